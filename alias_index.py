@@ -0,0 +1,180 @@
+"""
+Finds out which SVG (or PNG) files are aliases of other files, so that the
+artwork of each source file is processed once and the result is used for all
+of its aliases.
+
+A file is an alias if it's
+- a symbolic link;
+- a plain text file containing the name of the file it links to, which is
+  what git checks out instead of a symbolic link on file systems that don't
+  support them (e.g. with 'core.symlinks=false');
+- listed in one of the aliases files given to AliasIndex (e.g.
+  emoji_bw_aliases.txt), and has the same contents as its source file, which
+  is in the same directory. Such a file is a plain copy, so the tools that
+  modify the artwork write the result of its source to it too.
+"""
+import filecmp
+import io
+import logging
+import os
+
+# Kinds of aliases that are links to their source file
+LINK_KINDS = ('symlink', 'pseudo-link')
+
+FILE_PREFIX = 'u'
+
+# Git writes the target of a symbolic link into a file of its own; file
+# names longer than this are not expected
+PSEUDO_LINK_MAX_SIZE = 255
+
+log = logging.getLogger('alias_index')
+
+
+def parse_aliases_file(file_path):
+    """
+    Parses an emoji aliases text file.
+    Returns a list of tuples in the form ('src_name', 'dst_name').
+    """
+    with io.open(file_path, encoding='utf-8') as fp:
+        lines = fp.read().splitlines()
+
+    aliases_list = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        # strip in-line comments
+        comment_idx = line.find('#')
+        if comment_idx > 0:
+            line = line[:comment_idx].strip()
+        aliases_list.append(tuple(line.split(';')))
+    return aliases_list
+
+
+def read_listed_aliases(aliases_file_paths):
+    """
+    Reads aliases files.
+    Returns a dictionary of alias file names to source file names (without
+    file extension).
+    """
+    listed_aliases = {}
+    for aliases_file_path in aliases_file_paths:
+        listed_aliases.update(
+            ('{}{}'.format(FILE_PREFIX, dst_name),
+             '{}{}'.format(FILE_PREFIX, src_name))
+            for src_name, dst_name in parse_aliases_file(aliases_file_path))
+    return listed_aliases
+
+
+def read_pseudo_link(file_path):
+    """
+    Returns the target path of a plain text file written by git in place of a
+    symbolic link, or None if the file isn't one.
+    """
+    try:
+        if os.path.getsize(file_path) > PSEUDO_LINK_MAX_SIZE:
+            return None
+        with io.open(file_path, 'rb') as fp:
+            target = fp.read().decode('utf-8')
+    except (OSError, ValueError):
+        return None
+    if not target or set(target).intersection('<>\r\n\0'):
+        return None
+    target_path = os.path.join(os.path.dirname(file_path), target)
+    return target_path if os.path.isfile(target_path) else None
+
+
+class AliasIndex(object):
+    """
+    Maps each of a list of file paths to the real path of its source file.
+    Files that aren't aliases are their own source. The copies listed in the
+    'aliases_files' are recognized as aliases too.
+    """
+
+    def __init__(self, file_paths, aliases_files=()):
+        self._sources = {}
+        self._alias_kinds = {}  # key: alias file path; value: kind
+        self._listed_aliases = read_listed_aliases(aliases_files)
+        counts = {'symlink': 0, 'pseudo-link': 0, 'listed': 0}
+        for file_path in file_paths:
+            source_path, kind = self._resolve(file_path)
+            self._sources[file_path] = source_path
+            if kind:
+                self._alias_kinds[file_path] = kind
+                counts[kind] += 1
+        log.info('Found {} aliases ({} symbolic links, {} pseudo-links, {} '
+                 'listed in aliases files).'.format(
+                     len(self._alias_kinds), counts['symlink'],
+                     counts['pseudo-link'], counts['listed']))
+
+    def _get_listed_source(self, file_path):
+        dir_path, file_name = os.path.split(file_path)
+        name, ext = os.path.splitext(file_name)
+        src_name = self._listed_aliases.get(name)
+        if src_name is None or not os.path.isfile(file_path):
+            return None
+        src_path = os.path.join(dir_path, src_name + ext)
+        if not os.path.isfile(src_path):
+            return None
+        if not filecmp.cmp(file_path, src_path, shallow=False):
+            log.debug("'{}' is listed as an alias of '{}', but their "
+                      "contents differ.".format(file_path, src_path))
+            return None
+        return src_path
+
+    def _resolve(self, file_path):
+        """
+        Follows a chain of aliases up to the source file.
+        Returns a tuple of the real path of the source file, and the kind of
+        the first alias of the chain (None if 'file_path' isn't an alias).
+        """
+        path = file_path
+        first_kind = None
+        visited = set()
+        while path not in visited:
+            visited.add(path)
+            if os.path.islink(path):
+                target = os.readlink(path)
+                next_path = os.path.join(os.path.dirname(path), target)
+                kind = 'symlink'
+            else:
+                next_path = read_pseudo_link(path)
+                kind = 'pseudo-link'
+                if next_path is None:
+                    next_path = self._get_listed_source(path)
+                    kind = 'listed'
+            if next_path is None:
+                break
+            first_kind = first_kind or kind
+            path = os.path.normpath(next_path)
+        else:
+            log.warning("The aliases of '{}' form a loop.".format(file_path))
+            return os.path.realpath(file_path), None
+        return os.path.realpath(path), first_kind
+
+    def get_source(self, file_path):
+        """
+        Returns the real path of the source file of 'file_path'.
+        """
+        return self._sources[file_path]
+
+    def is_alias(self, file_path):
+        return file_path in self._alias_kinds
+
+    def is_link(self, file_path):
+        """
+        Returns True if 'file_path' is a symbolic link or a pseudo-link,
+        which share the data of their source file. The listed aliases are
+        copies of their source file.
+        """
+        return self._alias_kinds.get(file_path) in LINK_KINDS
+
+    def get_groups(self):
+        """
+        Returns a dictionary of source file real paths to lists of the file
+        paths that use them, in the order the paths were indexed.
+        """
+        groups = {}
+        for file_path, source_path in self._sources.items():
+            groups.setdefault(source_path, []).append(file_path)
+        return groups
@@ -0,0 +1,148 @@
+"""
+Compares the time make_bw_font spends reading and parsing the SVG files when
+each file is parsed once (parse_svg_file) with the former approach of reading
+the whole file for checking its viewBox (read_svg_size, a copy of the former
+get_svg_size) and then reading and parsing it again (SVGPath). Only the
+reading and parsing are timed, not the drawing.
+"""
+import argparse
+import glob
+import io
+import logging
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from fontTools.pens.t2CharStringPen import T2CharStringPen  # noqa: E402
+from fontTools.svgLib.path import SVGPath  # noqa: E402
+
+from make_bw_font import (  # noqa: E402
+    EMOJI_H_ADV, RE_VIEWBOX, parse_svg_file, parse_viewbox_values)
+
+DEFAULT_SVG_DIRS = [os.path.join(os.path.dirname(BENCH_DIR), dir_name)
+                    for dir_name in ('svg_bw', 'flags_bw')]
+
+log = logging.getLogger('bench_bw_svg_parse')
+
+
+def read_svg_size(svg_file_path):
+    """
+    The former get_svg_size() of make_bw_font, which reads the whole SVG
+    file for checking its viewBox.
+    Returns the viewBox dimension as an integer, or None if it's not valid.
+    """
+    with io.open(svg_file_path, encoding='utf-8') as fp:
+        svg_str = fp.read()
+
+    vb = RE_VIEWBOX.search(svg_str)
+    if not vb:
+        log.error(f"'viewBox' property not found in {svg_file_path}")
+        return
+
+    min_x, min_y, width, height = parse_viewbox_values(vb.group(3))
+    if not (min_x == min_y == 0):
+        log.error("The origin of the 'viewBox' is not zero. "
+                  f"min-x: {min_x}; min-y: {min_y}; {svg_file_path}")
+        return
+
+    if width != height:
+        log.error("The 'viewBox' is not square. "
+                  f"width: {width}; height: {height}; {svg_file_path}")
+        return
+
+    return width
+
+
+def parse_twice(fpaths):
+    results = []
+    for fpath in fpaths:
+        size = read_svg_size(fpath)
+        results.append((SVGPath(fpath).root, size))
+    return results
+
+
+def parse_once(fpaths):
+    return [parse_svg_file(fpath) for fpath in fpaths]
+
+
+def time_func(func, fpaths, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = func(fpaths)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, results
+
+
+def draw_root(root):
+    pen = T2CharStringPen(EMOJI_H_ADV, None)
+    svg = SVGPath()
+    svg.root = root
+    svg.draw(pen)
+    return pen.getCharString().program
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        'in_dirs',
+        help='directories containing SVG files. Defaults to svg_bw and '
+             'flags_bw',
+        metavar='DIR',
+        nargs='*',
+        default=DEFAULT_SVG_DIRS,
+    )
+    parser.add_argument(
+        '-n',
+        '--repeat',
+        help='number of timed runs; the best one is reported. '
+             'Defaults to %(default)s',
+        type=int,
+        default=3,
+    )
+    parser.add_argument(
+        '--verify',
+        action='store_true',
+        help='also check that both parses draw the same outlines (slow)',
+    )
+    opts = parser.parse_args(args)
+    logging.basicConfig(level='ERROR')
+
+    fpaths = []
+    for in_dir in opts.in_dirs:
+        fpaths.extend(sorted(glob.iglob(os.path.join(in_dir, '*.svg'))))
+    if not fpaths:
+        print('No SVG files found.')
+        return 1
+    total_bytes = sum(os.path.getsize(fpath) for fpath in fpaths)
+
+    twice_time, twice_results = time_func(parse_twice, fpaths, opts.repeat)
+    once_time, once_results = time_func(parse_once, fpaths, opts.repeat)
+
+    mismatches = [fpath for fpath, (_, twice_size), (_, once_size) in zip(
+        fpaths, twice_results, once_results) if twice_size != once_size]
+    if opts.verify:
+        mismatches.extend(
+            fpath for fpath, (twice_root, _), (once_root, _) in zip(
+                fpaths, twice_results, once_results)
+            if draw_root(twice_root) != draw_root(once_root))
+
+    print(f'{len(fpaths)} files, {total_bytes / 1e6:.1f} MB')
+    print(f'read twice, parse twice: {twice_time:8.3f} s  '
+          f'({2 * total_bytes / 1e6:.1f} MB read)')
+    print(f'read once, parse once:   {once_time:8.3f} s  '
+          f'({total_bytes / 1e6:.1f} MB read; {twice_time / once_time:.2f}x, '
+          f'{(twice_time - once_time) * 1000 / len(fpaths):.2f} ms saved '
+          'per file)')
+    print(f'different results: {len(mismatches)}')
+    for fpath in mismatches:
+        print(f'  {fpath}')
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""
+Measures the node trees built by svg_cleaner's SvgCleaner: the number of
+nodes, the memory allocated and the time taken for parsing each SVG file,
+and the peak resident set size of the whole run. With --compare, each file is
+also parsed into nodes without __slots__, like the ones svg_cleaner used
+before, to compare the two.
+"""
+import argparse
+from contextlib import contextmanager
+import csv
+import glob
+import io
+import logging
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+import svg_cleaner  # noqa: E402
+from svg_cleaner import SvgCleaner  # noqa: E402
+
+DEFAULT_DIRS = [os.path.join(ROOT_DIR, 'svg'), os.path.join(ROOT_DIR, 'flags')]
+
+
+class _Dict_Elem_Node(object):
+    """The element node of svg_cleaner without __slots__."""
+
+    def __init__(self, name, attrs, contents):
+        self.name = name
+        self.attrs = attrs
+        self.contents = contents
+
+
+class _Dict_Text_Node(object):
+    """The text node of svg_cleaner without __slots__."""
+
+    def __init__(self, text):
+        self.text = text
+
+
+@contextmanager
+def node_classes(elem_cls, text_cls):
+    """Makes svg_cleaner build its trees with the given node classes."""
+    saved = svg_cleaner._Elem_Node, svg_cleaner._Text_Node
+    svg_cleaner._Elem_Node, svg_cleaner._Text_Node = elem_cls, text_cls
+    try:
+        yield
+    finally:
+        svg_cleaner._Elem_Node, svg_cleaner._Text_Node = saved
+
+
+def count_nodes(node):
+    count = 0
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(getattr(node, 'contents', ()))
+    return count
+
+
+def get_peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux, and in bytes on macOS; it's the
+    # peak of the whole process so far, so it's only reported for the run
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return max_rss / 1e6
+    return max_rss / 1e3
+
+
+def measure_tree(cleaner, data):
+    """
+    Returns the node count, the parse time (in seconds) and the allocation
+    peak (in bytes) of the tree of an SVG document.
+    """
+    start = time.perf_counter()
+    tree = cleaner.tree_from_text(data)
+    parse_time = time.perf_counter() - start
+    node_count = count_nodes(tree)
+    del tree
+
+    # measured separately, because tracing slows down the parsing
+    tracemalloc.start()
+    tree = cleaner.tree_from_text(data)
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del tree
+    return node_count, parse_time, peak_bytes
+
+
+def measure_file(cleaner, fpath, compare=False):
+    with io.open(fpath, encoding='utf-8') as fp:
+        data = fp.read()
+
+    node_count, parse_time, peak_bytes = measure_tree(cleaner, data)
+    row = {
+        'file': fpath,
+        'bytes': len(data.encode('utf-8')),
+        'nodes': node_count,
+        'parse_ms': parse_time * 1e3,
+        'peak_alloc_kb': peak_bytes / 1e3,
+    }
+    if compare:
+        with node_classes(_Dict_Elem_Node, _Dict_Text_Node):
+            _, parse_time, peak_bytes = measure_tree(cleaner, data)
+        row['dict_parse_ms'] = parse_time * 1e3
+        row['dict_peak_alloc_kb'] = peak_bytes / 1e3
+    return row
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        'in_dirs',
+        help='directories containing SVG files. Defaults to svg and flags',
+        metavar='DIR',
+        nargs='*',
+    )
+    parser.add_argument(
+        '--csv',
+        help='path of a CSV file for saving the measurements of every file',
+        metavar='FILE',
+    )
+    parser.add_argument(
+        '--compare',
+        help='also parse each file into nodes without __slots__',
+        action='store_true',
+    )
+    parser.add_argument(
+        '-t',
+        '--top',
+        help='number of slowest files to list. Defaults to %(default)s',
+        type=int,
+        default=10,
+    )
+    opts = parser.parse_args(args)
+    logging.disable(logging.WARNING)
+
+    cleaner = SvgCleaner()
+    rows = []
+    for in_dir in opts.in_dirs or DEFAULT_DIRS:
+        for fpath in sorted(glob.iglob(os.path.join(in_dir, '*.svg'))):
+            rows.append(measure_file(cleaner, fpath, opts.compare))
+    if not rows:
+        print('No SVG files found.')
+        return 1
+
+    if opts.csv:
+        with io.open(opts.csv, 'w', encoding='utf-8', newline='') as fp:
+            writer = csv.DictWriter(fp, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+
+    print(f"{len(rows)} files, {sum(r['bytes'] for r in rows) / 1e6:.1f} MB, "
+          f"{sum(r['nodes'] for r in rows)} nodes")
+    print(f"total parse time: {sum(r['parse_ms'] for r in rows) / 1e3:.2f} s")
+    print(f"largest allocation peak: "
+          f"{max(r['peak_alloc_kb'] for r in rows) / 1e3:.1f} MB")
+    if opts.compare:
+        print(f"total parse time without __slots__: "
+              f"{sum(r['dict_parse_ms'] for r in rows) / 1e3:.2f} s")
+        print(f"largest allocation peak without __slots__: "
+              f"{max(r['dict_peak_alloc_kb'] for r in rows) / 1e3:.1f} MB")
+    print(f"peak RSS of the run: {get_peak_rss_mb():.1f} MB")
+    print()
+    print(f"{'parse ms':>9} {'nodes':>7} {'alloc KB':>9}  file")
+    for row in sorted(rows, key=lambda r: -r['parse_ms'])[:opts.top]:
+        print(f"{row['parse_ms']:9.1f} {row['nodes']:7d} "
+              f"{row['peak_alloc_kb']:9.0f}  {row['file']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+"""
+Compares the speed of make_svg_font's single-pass SVG normalizer with the
+chain of set_svg_id(), adjust_viewbox() and clean_svg_doc(), and checks that
+both produce the same documents.
+"""
+import argparse
+import glob
+import io
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from make_svg_font import (  # noqa: E402
+    VIEWBOX_SCALE, adjust_viewbox, clean_svg_doc, normalize_svg_doc,
+    set_svg_id)
+
+DEFAULT_SVG_DIR = os.path.join(os.path.dirname(BENCH_DIR), 'svg')
+
+
+def run_chain(docs):
+    results = []
+    for gid, (fpath, data) in enumerate(docs, 1):
+        data = set_svg_id(data, gid)
+        data = adjust_viewbox(data, fpath, VIEWBOX_SCALE)
+        data = clean_svg_doc(data)
+        results.append(data.strip())
+    return results
+
+
+def run_single_pass(docs):
+    return [normalize_svg_doc(data, gid, fpath, VIEWBOX_SCALE)
+            for gid, (fpath, data) in enumerate(docs, 1)]
+
+
+def time_func(func, docs, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = func(docs)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, results
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        'in_dir',
+        help='directory containing SVG files. Defaults to %(default)s',
+        metavar='DIR',
+        nargs='?',
+        default=DEFAULT_SVG_DIR,
+    )
+    parser.add_argument(
+        '-n',
+        '--repeat',
+        help='number of timed runs; the best one is reported. '
+             'Defaults to %(default)s',
+        type=int,
+        default=5,
+    )
+    opts = parser.parse_args(args)
+
+    docs = []
+    for fpath in sorted(glob.iglob(os.path.join(opts.in_dir, '*.svg'))):
+        with io.open(fpath, encoding='utf-8') as fp:
+            docs.append((fpath, fp.read()))
+    if not docs:
+        print('No SVG files found.')
+        return 1
+    total_bytes = sum(len(data) for _, data in docs)
+
+    chain_time, chain_results = time_func(run_chain, docs, opts.repeat)
+    single_time, single_results = time_func(run_single_pass, docs,
+                                            opts.repeat)
+
+    mismatches = [fpath for (fpath, _), chain_doc, single_doc in zip(
+        docs, chain_results, single_results) if chain_doc != single_doc]
+
+    print(f'{len(docs)} documents, {total_bytes / 1e6:.1f} MB')
+    print(f'regex chain: {chain_time:8.3f} s')
+    print(f'single pass: {single_time:8.3f} s  '
+          f'({chain_time / single_time:.2f}x)')
+    print(f'different outputs: {len(mismatches)}')
+    for fpath in mismatches:
+        print(f'  {fpath}')
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
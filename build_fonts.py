@@ -0,0 +1,317 @@
+"""
+Builds the sans-color and the color emoji fonts in a single process.
+The fonts are kept in memory between the build stages, and each of them is
+written to disk only once.
+"""
+import argparse
+import glob
+import io
+import logging
+import os
+import sys
+
+from alias_index import AliasIndex
+from build_profile import BuildProfiler
+import make_bw_font
+import make_svg_font
+import split_fonts
+from make_bw_font import (
+    get_font_data, normalize_path, parse_uvs_file, subroutinize_font_data,
+    validate_job_count, validate_revision_number)
+from web_fonts import (
+    check_web_formats, format_web_fonts_table, make_web_fonts,
+    validate_web_formats)
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# The aliases files of the SVG directories (see alias_index.py)
+BW_ALIASES_FILES = [os.path.join(ROOT_DIR, file_name) for file_name in (
+    'emoji_bw_aliases.txt', 'flag_bw_aliases.txt')]
+COLOR_ALIASES_FILES = [os.path.join(ROOT_DIR, file_name) for file_name in (
+    'emoji_color_aliases.txt', 'flag_color_aliases.txt')]
+
+log = logging.getLogger('build_fonts')
+
+
+def get_svg_file_paths(in_dirs):
+    file_paths = []
+    for in_dir in in_dirs:
+        fpaths = sorted(glob.iglob(os.path.join(in_dir, '*.[sS][vV][gG]')))
+        file_paths.extend(fpaths)
+        log.info(f"Found {len(fpaths)} SVG files in '{in_dir}'.")
+    return file_paths
+
+
+def get_file_gname(file_path):
+    return os.path.splitext(os.path.basename(file_path))[0]
+
+
+def get_unshared_color_glyphs(bw_file_paths, color_file_paths):
+    """
+    Returns the names of the glyphs whose BW artwork is an alias of another
+    glyph's, but whose color artwork isn't. Those glyphs must be kept in the
+    BW font, or the color font would have no glyph for their color artwork.
+    """
+    color_index = AliasIndex(color_file_paths, COLOR_ALIASES_FILES)
+    color_sources = {get_file_gname(fpath): color_index.get_source(fpath)
+                     for fpath in color_file_paths}
+    unshared_gnames = set()
+    bw_index = AliasIndex(bw_file_paths, BW_ALIASES_FILES)
+    for fpath, canon_fpath in make_bw_font.get_glyph_aliases(
+            bw_file_paths, bw_index).items():
+        gname = get_file_gname(fpath)
+        if color_sources.get(gname) != color_sources.get(
+                get_file_gname(canon_fpath)):
+            unshared_gnames.add(gname)
+    return unshared_gnames
+
+
+def write_file_data(file_path, data):
+    """
+    Writes the data to a temporary file first, and then renames it, so that
+    a half-written file never exists at 'file_path'.
+    """
+    tmp_path = file_path + '.tmp'
+    with io.open(tmp_path, 'wb') as fp:
+        fp.write(data)
+    os.replace(tmp_path, file_path)
+
+
+def build_fonts(out_dir, revision, jobs=1, cache_dir=None, incremental=False,
+                subroutinize=True, profiler=None, compressor='gzip',
+                compression_level=make_svg_font.DEFAULT_COMPRESSION_LEVEL,
+                compression_report=None, alias_glyphs=False, web_formats=(),
+                split=None):
+    if profiler is None:
+        profiler = BuildProfiler('build_fonts', enabled=False)
+
+    with profiler.phase('glob'):
+        bw_file_paths = get_svg_file_paths(
+            [os.path.join(ROOT_DIR, dir_name)
+             for dir_name in ('svg_bw', 'flags_bw')])
+        color_file_paths = get_svg_file_paths(
+            [os.path.join(ROOT_DIR, dir_name)
+             for dir_name in ('svg', 'flags')])
+
+    keep_glyphs = ()
+    if alias_glyphs:
+        with profiler.phase('alias_index'):
+            keep_glyphs = get_unshared_color_glyphs(
+                bw_file_paths, color_file_paths)
+
+    # BW font; its ligature substitutions are made from the glyph names
+    uvs = parse_uvs_file(os.path.join(ROOT_DIR, 'UVS.txt'))
+    bw_font = make_bw_font.build_font(
+        bw_file_paths, revision, None, os.path.join(ROOT_DIR, 'GPOS.fea'),
+        uvs, jobs, cache_dir, profiler, ligatures=True,
+        alias_glyphs=alias_glyphs, keep_glyphs=keep_glyphs,
+        aliases_files=BW_ALIASES_FILES)
+    with profiler.phase('bw.compile'):
+        bw_font_data = get_font_data(bw_font)
+    bw_font.close()
+
+    if subroutinize:
+        with profiler.phase('bw.subroutinize'):
+            bw_font_data = subroutinize_font_data(bw_font_data)
+
+    bw_font_path = os.path.join(out_dir, make_bw_font.PS_NAME + '.otf')
+    write_file_data(bw_font_path, bw_font_data)
+    log.info(f"Wrote '{bw_font_path}'.")
+
+    # color font; its tables are loaded from the BW font's data on demand
+    color_font = make_svg_font.load_font(io.BytesIO(bw_font_data))
+    svg_font_path = make_svg_font.get_svg_font_path(color_font, bw_font_path)
+
+    prev_build = None
+    compression = make_svg_font.get_compression_settings(
+        compressor, compression_level)
+    if incremental:
+        with profiler.phase('color.previous_build'):
+            prev_build = make_svg_font.read_previous_svg_docs(
+                svg_font_path, compression)
+
+    docs_manifest = make_svg_font.set_svg_table(
+        color_font, color_file_paths, True, True, prev_build, profiler,
+        compressor, compression_level, jobs, compression_report,
+        COLOR_ALIASES_FILES)
+    if docs_manifest is None:
+        color_font.close()
+        return 1
+    make_svg_font.set_font_names(color_font, revision)
+
+    with profiler.phase('color.compile'):
+        color_font_data = get_font_data(color_font)
+    color_font.close()
+    write_file_data(svg_font_path, color_font_data)
+    # refreshed on every build, so that it always matches the font
+    make_svg_font.write_svg_manifest(svg_font_path, docs_manifest,
+                                     compression)
+    log.info(f"Wrote '{svg_font_path}' containing {len(docs_manifest)} "
+             "SVG glyphs.")
+
+    # the two fonts are compressed at the same time
+    if web_formats:
+        with profiler.phase('web_fonts'):
+            rows = make_web_fonts(
+                [(bw_font_path, bw_font_data),
+                 (svg_font_path, color_font_data)], web_formats)
+        print(format_web_fonts_table(rows))
+
+    if split:
+        with profiler.phase('split'):
+            split_fonts.split_fonts(
+                bw_font_data, color_font_data,
+                os.path.join(out_dir, split_fonts.CHUNKS_DIRNAME), split,
+                web_formats=web_formats, jobs=jobs)
+    return 0
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '-v',
+        '--verbose',
+        help='verbose mode. Use -vv for debug mode',
+        action='count',
+        default=0
+    )
+    parser.add_argument(
+        'revision',
+        help="the fonts' revision number (e.g. 1.082)",
+        type=validate_revision_number,
+    )
+    parser.add_argument(
+        '-o',
+        '--out-dir',
+        help='directory to save the fonts in. Defaults to %(default)s',
+        metavar='DIR',
+        type=normalize_path,
+        default=os.path.join(ROOT_DIR, 'fonts'),
+    )
+    parser.add_argument(
+        '-j',
+        '--jobs',
+        help=('number of worker processes used for converting the SVG '
+              'files and compressing the SVG documents. Defaults to '
+              '%(default)s'),
+        type=validate_job_count,
+        default=1,
+    )
+    parser.add_argument(
+        '--cache-dir',
+        help=('directory for caching the converted glyph outlines and the '
+              'compiled feature tables between builds. Only the SVG files '
+              'that changed are converted again.'),
+        metavar='DIR',
+        type=normalize_path,
+    )
+    parser.add_argument(
+        '-i',
+        '--incremental',
+        action='store_true',
+        help=('reuse the SVG documents of the previous color font build for '
+              'the SVG files that did not change')
+    )
+    parser.add_argument(
+        '--no-subroutinize',
+        action='store_false',
+        dest='subroutinize',
+        help=("don't subroutinize the BW font. Subroutinizing requires "
+              "the cffsubr package")
+    )
+    parser.add_argument(
+        '--alias-glyphs',
+        action='store_true',
+        help=('store the outline of aliased SVG files once in the BW font. '
+              'Only the glyphs whose color artwork is aliased too are merged')
+    )
+    parser.add_argument(
+        '--compressor',
+        help=("encoder used for compressing the SVG documents. 'zopfli' "
+              "makes a smaller table, but is much slower, and requires the "
+              "zopfli package. Defaults to %(default)s"),
+        choices=make_svg_font.COMPRESSORS,
+        default='gzip',
+    )
+    parser.add_argument(
+        '--compression-level',
+        help=("compression level of the 'gzip' compressor, from 1 (fastest) "
+              "to 9 (smallest). Defaults to %(default)s"),
+        type=make_svg_font.validate_compression_level,
+        default=make_svg_font.DEFAULT_COMPRESSION_LEVEL,
+    )
+    parser.add_argument(
+        '--compression-report',
+        help=('path to a JSON file for saving the time of the compression, '
+              'and the sizes of the SVG table and of each document'),
+        metavar='FILE',
+        type=normalize_path,
+    )
+    parser.add_argument(
+        '--web-formats',
+        help=('comma-separated list of web font formats (woff2, woff) to '
+              'also save both fonts in. WOFF2 requires the brotli package'),
+        metavar='FORMATS',
+        type=validate_web_formats,
+        default=[],
+    )
+    parser.add_argument(
+        '--split',
+        help=('also split both fonts into this number of chunks of emoji '
+              "groups, and save them with a CSS file in a '{}' "
+              'subdirectory'.format(split_fonts.CHUNKS_DIRNAME)),
+        metavar='N',
+        type=split_fonts.validate_chunk_count,
+    )
+    parser.add_argument(
+        '--profile',
+        help=('path to a JSON file for saving the wall time and peak memory '
+              'of each build phase, and the slowest SVG files'),
+        metavar='FILE',
+        type=normalize_path,
+    )
+    opts = parser.parse_args(args)
+
+    if not opts.verbose:
+        level = "WARNING"
+    elif opts.verbose == 1:
+        level = "INFO"
+    else:
+        level = "DEBUG"
+    logging.basicConfig(level=level)
+
+    if opts.subroutinize and make_bw_font.cffsubr is None:
+        log.error("Subroutinizing the BW font requires the 'cffsubr' "
+                  "package. Install it with 'pip install cffsubr', or use "
+                  "the --no-subroutinize option.")
+        return 1
+
+    if opts.compressor == 'zopfli' and make_svg_font.zopfli is None:
+        log.error("The 'zopfli' compressor requires the 'zopfli' package. "
+                  "Install it with 'pip install zopfli'.")
+        return 1
+
+    if not check_web_formats(opts.web_formats):
+        return 1
+
+    out_path = os.path.abspath(os.path.realpath(opts.out_dir))
+    # create directory if it doesn't exist
+    if not os.path.exists(out_path):
+        os.makedirs(out_path)
+    # the path exists but it's NOT a directory
+    elif not os.path.isdir(out_path):
+        log.error("'{}' is not a directory.".format(opts.out_dir))
+        return 1
+
+    profiler = BuildProfiler('build_fonts', enabled=bool(opts.profile))
+    result = build_fonts(opts.out_dir, opts.revision, opts.jobs,
+                         opts.cache_dir, opts.incremental, opts.subroutinize,
+                         profiler, opts.compressor, opts.compression_level,
+                         opts.compression_report, opts.alias_glyphs,
+                         opts.web_formats, opts.split)
+    profiler.save(opts.profile)
+    return result
+
+
+if __name__ == "__main__":
+    sys.exit(main())
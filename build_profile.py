@@ -0,0 +1,127 @@
+"""
+Records the wall time of the phases of a font build, how much each of them
+raised the peak memory of the process, and the time spent on individual files,
+and saves them as a JSON report.
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+import io
+import json
+import logging
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+SLOWEST_FILES_COUNT = 20
+
+log = logging.getLogger('build_profile')
+
+
+def get_peak_rss(children=False):
+    """
+    Returns the peak resident set size (in bytes) of the current process, or
+    the largest one of its terminated child processes (e.g. the workers of a
+    process pool), or None if it can't be determined. The peak is the
+    highest since the process started, so it never decreases.
+    """
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux, and in bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    return resource.getrusage(who).ru_maxrss * scale
+
+
+def get_rss_increase(start_rss, end_rss):
+    if start_rss is None or end_rss is None:
+        return None
+    return end_rss - start_rss
+
+
+class BuildProfiler(object):
+    """
+    Collects timing data of a build. When 'enabled' is False all the methods
+    do nothing, so the profiler can be passed around unconditionally.
+    """
+
+    def __init__(self, tool_name, enabled=True):
+        self.tool_name = tool_name
+        self.enabled = enabled
+        self._phases = []
+        # the whole run is timed from the creation of the profiler
+        self._start = time.perf_counter()
+        self._file_times = defaultdict(dict)  # key: file; value: {phase: s}
+
+    @contextmanager
+    def phase(self, name):
+        """Context manager that measures a phase of the build."""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        start_rss = get_peak_rss()
+        start_children_rss = get_peak_rss(children=True)
+        try:
+            yield
+        finally:
+            wall_time = time.perf_counter() - start
+            end_rss = get_peak_rss()
+            end_children_rss = get_peak_rss(children=True)
+            # ru_maxrss is a high-water mark, so a phase is only charged with
+            # the amount by which it raised the peak; the peaks so far are
+            # recorded too
+            self._phases.append({
+                'name': name,
+                'wall_time': round(wall_time, 6),
+                'peak_rss_increase': get_rss_increase(start_rss, end_rss),
+                'children_peak_rss_increase': get_rss_increase(
+                    start_children_rss, end_children_rss),
+                'process_peak_rss_so_far': end_rss,
+                'children_peak_rss_so_far': end_children_rss,
+            })
+            log.info('{}: {:.3f} s'.format(name, wall_time))
+
+    def add_file_time(self, file_path, phase_name, seconds):
+        """Records the time spent on a file during a phase."""
+        if self.enabled:
+            file_times = self._file_times[file_path]
+            file_times[phase_name] = file_times.get(phase_name, 0) + seconds
+
+    def get_report(self):
+        phase_totals = defaultdict(lambda: {'time': 0, 'files': 0})
+        for file_times in self._file_times.values():
+            for phase_name, seconds in file_times.items():
+                phase_totals[phase_name]['time'] += seconds
+                phase_totals[phase_name]['files'] += 1
+        for totals in phase_totals.values():
+            totals['time'] = round(totals['time'], 6)
+
+        slowest_files = sorted(
+            self._file_times.items(), key=lambda item: -sum(item[1].values())
+        )[:SLOWEST_FILES_COUNT]
+
+        return {
+            'tool': self.tool_name,
+            'total_wall_time': round(time.perf_counter() - self._start, 6),
+            'process_peak_rss': get_peak_rss(),
+            'children_peak_rss': get_peak_rss(children=True),
+            'phases': self._phases,
+            'file_phases': dict(phase_totals),
+            'slowest_files': [
+                {'file': file_path,
+                 'time': round(sum(file_times.values()), 6),
+                 'phases': {phase_name: round(seconds, 6)
+                            for phase_name, seconds in file_times.items()}}
+                for file_path, file_times in slowest_files],
+        }
+
+    def save(self, report_path):
+        if not self.enabled:
+            return
+        with io.open(report_path, 'w', encoding='utf-8') as fp:
+            json.dump(self.get_report(), fp, indent=2)
+        log.info("Saved profile report '{}'.".format(report_path))
@@ -0,0 +1,105 @@
+"""
+Checks that the SVG files of one or more directories have a square viewBox
+whose origin is zero, and prints a summary table.
+Only the start tag of the files' root element is read.
+"""
+import argparse
+from collections import Counter
+import glob
+import logging
+import os
+import sys
+
+from make_bw_font import check_svg_viewbox, validate_dir_path
+
+log = logging.getLogger('check_viewboxes')
+
+
+def check_viewboxes(dir_path):
+    """
+    Checks the viewBox of each SVG file in a directory.
+    Returns a dictionary containing the number of files checked ('files'),
+    a Counter of the valid viewBox sizes ('sizes'), and a list of the error
+    messages of the files whose viewBox isn't valid ('errors').
+    """
+    summary = {'files': 0, 'sizes': Counter(), 'errors': []}
+    for fpath in sorted(glob.iglob(os.path.join(dir_path, '*.[sS][vV][gG]'))):
+        summary['files'] += 1
+        try:
+            size, error = check_svg_viewbox(fpath)
+        except (AssertionError, SyntaxError, ValueError) as err:
+            size, error = None, f"Invalid 'viewBox' values ({err}); {fpath}"
+        if error:
+            summary['errors'].append(error)
+        else:
+            summary['sizes'][size] += 1
+    return summary
+
+
+def format_summary_table(summaries):
+    """
+    Takes a dictionary of directory paths to summaries returned by
+    check_viewboxes(), and returns a table of them as a string.
+    """
+    header = ('Directory', 'Files', 'Valid', 'Invalid', 'viewBox sizes')
+    rows = []
+    for dir_path, summary in summaries.items():
+        sizes = ', '.join(f'{size} ({count})' for size, count in
+                          sorted(summary['sizes'].items()))
+        invalid = len(summary['errors'])
+        rows.append((dir_path, str(summary['files']),
+                     str(summary['files'] - invalid), str(invalid), sizes))
+
+    widths = [max(len(row[i]) for row in [header] + rows)
+              for i in range(len(header))]
+    lines = []
+    for row in [header] + rows:
+        cells = [row[0].ljust(widths[0])]
+        cells.extend(cell.rjust(width)
+                     for cell, width in zip(row[1:4], widths[1:4]))
+        cells.append(row[4])
+        lines.append('  '.join(cells).rstrip())
+    lines.insert(1, '-' * len(lines[0]))
+    return '\n'.join(lines)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '-v',
+        '--verbose',
+        help='verbose mode. Use -vv for debug mode',
+        action='count',
+        default=0
+    )
+    parser.add_argument(
+        'in_dirs',
+        help='one or more input directories containing SVG files',
+        metavar='DIR',
+        nargs='+',
+        type=validate_dir_path,
+    )
+    opts = parser.parse_args(args)
+
+    if not opts.verbose:
+        level = "WARNING"
+    elif opts.verbose == 1:
+        level = "INFO"
+    else:
+        level = "DEBUG"
+    logging.basicConfig(level=level)
+
+    summaries = {}
+    for in_dir in opts.in_dirs:
+        summaries[in_dir] = summary = check_viewboxes(in_dir)
+        for error in summary['errors']:
+            log.error(error)
+
+    print(format_summary_table(summaries))
+
+    if any(summary['errors'] for summary in summaries.values()):
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""
+Reads many files ahead of the code that processes them, using a pool of
+threads. This hides the latency of each read, which adds up on networked
+volumes when thousands of small SVG files are read one after the other.
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import io
+import itertools
+import logging
+import os
+
+DEFAULT_THREADS = 8
+# Maximum number of files that are read but not yet processed
+DEFAULT_PREFETCH = 64
+
+log = logging.getLogger('file_loader')
+
+
+def _read_file(file_path):
+    realpath = os.path.realpath(file_path)
+    try:
+        with io.open(file_path, 'rb') as fp:
+            data = fp.read()
+    except OSError as err:
+        log.debug("Failed to read '%s'. %s", file_path, err)
+        data = None
+    return realpath, data
+
+
+def read_files(file_paths, threads=DEFAULT_THREADS,
+               prefetch=DEFAULT_PREFETCH):
+    """
+    Reads a list of files using 'threads' threads, while the files already
+    read are being processed. At most 'prefetch' files are held in memory.
+    Yields (path, realpath, data) tuples in the same order as 'file_paths'.
+    'data' is the file's bytes, or None if the file couldn't be read; the
+    caller can then open the file itself to get the error.
+    """
+    file_paths = iter(file_paths)
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        pending = deque(
+            (file_path, executor.submit(_read_file, file_path))
+            for file_path in itertools.islice(file_paths, prefetch))
+        try:
+            while pending:
+                file_path, future = pending.popleft()
+                for next_path in itertools.islice(file_paths, 1):
+                    pending.append(
+                        (next_path, executor.submit(_read_file, next_path)))
+                realpath, data = future.result()
+                yield file_path, realpath, data
+        finally:
+            # the consumer stopped early
+            for _, future in pending:
+                future.cancel()
+
+
+def decode_text(data):
+    """
+    Decodes the bytes of a UTF-8 text file the same way io.open() does in
+    text mode, i.e. translating the line endings to '\\n'.
+    """
+    return data.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+
+
+def get_text(file_path, data):
+    """
+    Returns the text of a UTF-8 file yielded by read_files(). If the file
+    couldn't be read ('data' is None) it's opened again, which raises the
+    error.
+    """
+    if data is None:
+        with io.open(file_path, encoding='utf-8') as fp:
+            return fp.read()
+    return decode_text(data)
@@ -4,15 +4,14 @@
 Creates aliases of SVG or PNG files in the same directory.
 """
 import argparse
-import io
 import logging
 import os
 import sys
 
+from alias_index import FILE_PREFIX, parse_aliases_file
 from make_bw_font import validate_dir_path, validate_file_path
 
 
-FILE_PREFIX = 'u'
 FILE_EXTENSIONS = ('svg', 'png')
 
 log = logging.getLogger('make_aliases')
@@ -51,27 +50,6 @@ def make_aliases(aliases_list, in_dir):
             return 1
 
 
-def parse_aliases_file(file_path):
-    """
-    Parses an emoji aliases text file.
-    Returns a list of tuples in the form ('src_name', 'dst_name').
-    """
-    with io.open(file_path, encoding='utf-8') as fp:
-        lines = fp.read().splitlines()
-
-    aliases_list = []
-    for line in lines:
-        line = line.strip()
-        if not line or line.startswith('#'):
-            continue
-        # strip in-line comments
-        comment_idx = line.find('#')
-        if comment_idx > 0:
-            line = line[:comment_idx].strip()
-        aliases_list.append(tuple(line.split(';')))
-    return aliases_list
-
-
 def main(args=None):
     parser = argparse.ArgumentParser(description=__doc__)
     parser.add_argument(
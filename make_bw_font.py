@@ -5,19 +5,44 @@ Creates a sans-color emoji OT-CFF font from b&w SVG files.
 """
 import argparse
 from ast import literal_eval
+import base64
 from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import glob
+import hashlib
 import io
+import itertools
+import json
 import logging
 import os
 import re
 import sys
+import time
 
+from fontTools import version as fonttools_version
 from fontTools.feaLib.builder import addOpenTypeFeatures
 from fontTools.fontBuilder import FontBuilder
+from fontTools.misc import etree
 from fontTools.misc.psCharStrings import T2CharString
+from fontTools.otlLib.builder import buildLigatureSubstSubtable, buildLookup
+from fontTools.otlLib.maxContextCalc import maxCtxFont
+from fontTools.pens.boundsPen import BoundsPen
 from fontTools.pens.t2CharStringPen import T2CharStringPen
 from fontTools.svgLib.path import SVGPath
+from fontTools.ttLib import TTFont, newTable
+from fontTools.ttLib.tables import otTables
+
+try:
+    import cffsubr
+except ImportError:
+    cffsubr = None
+
+from alias_index import AliasIndex
+from build_profile import BuildProfiler
+from file_loader import read_files
+from web_fonts import (
+    check_web_formats, format_web_fonts_table, make_web_fonts,
+    validate_web_formats)
 
 COPYRIGHT = 'Copyright 2013 Google Inc.'
 TRADEMARK = 'Noto is a trademark of Google Inc.'
@@ -52,12 +77,29 @@ UNDERLINE_THICKNESS = 131
 
 SPACE_CHARSTRING = T2CharString(program=[EMOJI_H_ADV, 'endchar'])
 
+# The charstrings depend on the artwork and on the values used for scaling and
+# positioning it, so those values are part of the cache keys
+CS_CACHE_FILENAME = 'bw_charstrings.json'
+CS_CACHE_SALT = '{};{};{};{}'.format(
+    EMOJI_SIZE, EMOJI_H_ADV, ABOVE_BASELINE, fonttools_version).encode('utf-8')
+# The compiled feature tables depend on the feature files, on the glyph order
+# and on the version of the compiler
+FEA_CACHE_FILENAME = 'bw_features.json'
+FEA_CACHE_SALT = fonttools_version.encode('utf-8')
+
 RE_UNICODE = re.compile(r'^u[0-9a-f]{4,5}$', re.IGNORECASE)
+RE_SEQUENCE = re.compile(r'^u[0-9a-f]{4,5}(_[0-9a-f]{4,5})+$', re.IGNORECASE)
 RE_REVISION = re.compile(r'^[0-9]{1,3}\.[0-9]{3}$')
 # The value of the viewBox attribute is a list of four numbers
 # min-x, min-y, width and height, separated by whitespace and/or a comma
 RE_VIEWBOX = re.compile(
     r"(<svg.+?)(\s*viewBox=[\"|\']([-\d,. ]+)[\"|\'])(.+?>)", re.DOTALL)
+# The root element's start tag, and its viewBox attribute
+RE_SVG_START_TAG = re.compile(rb'<svg\b[^>]*>')
+RE_VIEWBOX_ATTR = re.compile(rb'\sviewBox=[\"\']([-\d,. ]+)[\"\']')
+# Number of bytes read when looking for the root element's start tag. It's
+# usually within the first 100 bytes of the files.
+SVG_HEADER_SIZE = 1024
 
 VALID_1STCHARS = tuple('_ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz')
 VALID_CHARS = VALID_1STCHARS + tuple('.0123456789')
@@ -65,6 +107,12 @@ VALID_CHARS = VALID_1STCHARS + tuple('.0123456789')
 TAG_LAT_LETTR = ('e0061 e0062 e0063 e0064 e0065 e0066 e0067 e0068 e0069 e006a '
                  'e006b e006c e006d e006e e006f e0070 e0071 e0072 e0073 e0074 '
                  'e0075 e0076 e0077 e0078 e0079 e007a e007f').split()
+CANCEL_TAG = 'e007f'
+
+# Pairs of REGIONAL INDICATOR SYMBOL LETTERs that don't have a flag glyph of
+# their own are displayed with the unknown flag glyph
+REG_IND_LETTR = ['{:x}'.format(cdpt) for cdpt in range(0x1f1e6, 0x1f200)]
+UNKNOWN_FLAG_GNAME = 'ufe82b'
 
 log = logging.getLogger('make_bw_font')
 
@@ -79,39 +127,464 @@ def parse_viewbox_values(vb_str):
     return [literal_eval(val) for val in list_str]
 
 
-def get_svg_size(svg_file_path):
+def read_svg_viewbox(svg_file_path):
     """
-    Takes a path to an SVG file and reads it.
-    Checks for the existence of a 'viewBox' property in the 'svg' element.
-    Confirms that the viewBox is square.
-    Returns the viewBox dimension as an integer.
+    Reads the beginning of an SVG file, up to the end of the start tag of its
+    root 'svg' element, instead of the whole file.
+    Returns the values string of the root element's 'viewBox' attribute, or
+    None if the attribute isn't found.
+    """
+    with io.open(svg_file_path, 'rb') as fp:
+        header = fp.read(SVG_HEADER_SIZE)
+        start_tag = RE_SVG_START_TAG.search(header)
+        # the start tag was cut off, or is preceded by long comments
+        if not start_tag:
+            header += fp.read()
+            start_tag = RE_SVG_START_TAG.search(header)
+    if not start_tag:
+        return None
+    vb = RE_VIEWBOX_ATTR.search(start_tag.group())
+    if not vb:
+        return None
+    return vb.group(1).decode('ascii')
 
-    The regex match will contain 4 groups:
-        1. String from '<svg' up to the space before 'viewBox'
-        2. The whole 'viewBox' property (e.g. ' viewBox="0 100 128 128"')
-        3. The 'viewBox' values
-        4. Remainder of the '<svg>' element
+
+def check_svg_viewbox(svg_file_path):
+    """
+    Checks for the existence of a 'viewBox' property in the root 'svg'
+    element of an SVG file, and confirms that the viewBox is square and that
+    its origin is zero.
+    Returns a tuple of the viewBox dimension and None, or of None and an
+    error message.
     """
-    with io.open(svg_file_path, encoding='utf-8') as fp:
-        svg_str = fp.read()
+    return check_viewbox_values(read_svg_viewbox(svg_file_path), svg_file_path)
 
-    vb = RE_VIEWBOX.search(svg_str)
-    if not vb:
-        log.error(f"'viewBox' property not found in {svg_file_path}")
-        return
 
-    min_x, min_y, width, height = parse_viewbox_values(vb.group(3))
+def check_viewbox_values(vb_str, svg_file_path):
+    """
+    Does the checks of check_svg_viewbox() on the values string of a viewBox
+    (or None, if the SVG file has no viewBox).
+    """
+    if vb_str is None:
+        return None, f"'viewBox' property not found in {svg_file_path}"
+
+    min_x, min_y, width, height = parse_viewbox_values(vb_str)
     if not (min_x == min_y == 0):
-        log.error("The origin of the 'viewBox' is not zero. "
-                  f"min-x: {min_x}; min-y: {min_y}; {svg_file_path}")
-        return
+        return None, ("The origin of the 'viewBox' is not zero. "
+                      f"min-x: {min_x}; min-y: {min_y}; {svg_file_path}")
 
     if width != height:
-        log.error("The 'viewBox' is not square. "
-                  f"width: {width}; height: {height}; {svg_file_path}")
+        return None, ("The 'viewBox' is not square. "
+                      f"width: {width}; height: {height}; {svg_file_path}")
+
+    return width, None
+
+
+def get_svg_size(svg_file_path):
+    """
+    Takes a path to an SVG file and validates the viewBox of its root 'svg'
+    element (see check_svg_viewbox).
+    Returns the viewBox dimension as an integer, or None if it's not valid.
+    """
+    size, error = check_svg_viewbox(svg_file_path)
+    if error:
+        log.error(error)
+    return size
+
+
+class BoundsT2CharStringPen(T2CharStringPen):
+    """
+    T2CharStringPen that also calculates the bounds of the glyph while it's
+    drawn. The bounds are calculated from the same rounded coordinates that
+    are stored in the charstring, so they're equal to the result of the
+    charstring's calcBounds() method, without having to interpret it again.
+    """
+
+    def __init__(self, width, glyphSet):
+        super(BoundsT2CharStringPen, self).__init__(width, glyphSet)
+        self._bounds_pen = BoundsPen(None)
+        self._pending_move = None
+
+    def _flush_move(self):
+        # successive moves are combined into one when the charstring is
+        # specialized, so only the last one of them counts
+        if self._pending_move is not None:
+            self._bounds_pen.moveTo(self._pending_move)
+            self._pending_move = None
+
+    def _moveTo(self, pt):
+        super(BoundsT2CharStringPen, self)._moveTo(pt)
+        self._pending_move = self._p0
+
+    def _lineTo(self, pt):
+        super(BoundsT2CharStringPen, self)._lineTo(pt)
+        self._flush_move()
+        self._bounds_pen.lineTo(self._p0)
+
+    def _curveToOne(self, pt1, pt2, pt3):
+        rounded_pts = [(self.round(x), self.round(y)) for x, y in (pt1, pt2)]
+        super(BoundsT2CharStringPen, self)._curveToOne(pt1, pt2, pt3)
+        self._flush_move()
+        self._bounds_pen.curveTo(*rounded_pts, self._p0)
+
+    def getBounds(self):
+        self._flush_move()
+        return self._bounds_pen.bounds
+
+
+def parse_svg_file(svg_file_path, data=None):
+    """
+    Reads and parses an SVG file. The file isn't read if its contents are
+    provided as 'data' (bytes).
+    Returns a tuple of the root element, and of the viewBox dimension (or
+    None if the viewBox isn't usable).
+    """
+    if data is None:
+        with io.open(svg_file_path, 'rb') as fp:
+            data = fp.read()
+    root = etree.fromstring(data)
+    size, error = check_viewbox_values(root.get('viewBox'), svg_file_path)
+    if error:
+        log.error(error)
+    return root, size
+
+
+def draw_svg_glyph(svg_file_path, data=None):
+    """
+    Converts the artwork of an SVG file into a Type 2 charstring, scaled and
+    positioned within the emoji's em-box. The file is parsed once, for both
+    checking its viewBox and drawing its paths. Its contents can be provided
+    as 'data' (see parse_svg_file).
+    Returns a tuple of the charstring, its bounds, and the time (in seconds)
+    spent parsing the SVG file and building the charstring; or None if the
+    SVG file doesn't have a usable viewBox.
+    """
+    start = time.perf_counter()
+    root, svg_size = parse_svg_file(svg_file_path, data)
+    if svg_size is None:
         return
 
-    return width
+    pen = BoundsT2CharStringPen(EMOJI_H_ADV, None)
+    svg = SVGPath(transform=(EMOJI_SIZE / svg_size, 0, 0,
+                             -EMOJI_SIZE / svg_size,
+                             (EMOJI_H_ADV * .5) - (EMOJI_SIZE * .5),
+                             EMOJI_H_ADV * ABOVE_BASELINE))
+    svg.root = root
+    parsed = time.perf_counter()
+    svg.draw(pen)
+    cs = pen.getCharString()
+    timings = (parsed - start, time.perf_counter() - parsed)
+    return cs, pen.getBounds(), timings
+
+
+def draw_svg_glyphs(svg_file_paths, jobs=1):
+    """
+    Converts a list of SVG files into Type 2 charstrings.
+    When 'jobs' is greater than 1 the files are spread over that many worker
+    processes; otherwise the files are read ahead of the conversion by a pool
+    of threads. Returns a list of (charstring, bounds, timings) tuples (or
+    None) in the same order as the input list.
+    """
+    if jobs > 1 and len(svg_file_paths) > 1:
+        chunksize = max(1, len(svg_file_paths) // (jobs * 4))
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            return list(executor.map(
+                draw_svg_glyph, svg_file_paths, chunksize=chunksize))
+    return [draw_svg_glyph(fpath, data)
+            for fpath, _, data in read_files(svg_file_paths)]
+
+
+def get_charstring_cache_key(svg_file_path, data=None):
+    """
+    Returns a hash of the contents of an SVG file combined with the values
+    used for transforming its artwork into a glyph. The file isn't read if
+    its contents are provided as 'data' (bytes).
+    """
+    if data is None:
+        with io.open(svg_file_path, 'rb') as fp:
+            data = fp.read()
+    sha = hashlib.sha256(CS_CACHE_SALT)
+    sha.update(data)
+    return sha.hexdigest()
+
+
+def get_features_cache_key(fea_path, glyph_order):
+    """
+    Returns a hash of the contents of a feature file combined with the glyph
+    order of the font and the version of the feature compiler.
+    """
+    with io.open(fea_path, 'rb') as fp:
+        data = fp.read()
+    sha = hashlib.sha256(FEA_CACHE_SALT)
+    sha.update(data)
+    sha.update(b'\0')
+    sha.update(' '.join(glyph_order).encode('utf-8'))
+    return sha.hexdigest()
+
+
+def read_cache_file(cache_dir, cache_filename):
+    """
+    Reads a cache file stored in 'cache_dir'.
+    Returns a dictionary of the cache entries, which is empty if the file
+    doesn't exist or can't be read.
+    """
+    cache_path = os.path.join(cache_dir, cache_filename)
+    if not os.path.isfile(cache_path):
+        return {}
+    try:
+        with io.open(cache_path, encoding='utf-8') as fp:
+            return json.load(fp)
+    except (OSError, ValueError) as err:
+        log.warning(f"Ignored unreadable cache file '{cache_path}'. {err}")
+        return {}
+
+
+def write_cache_file(cache_dir, cache_filename, entries):
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    cache_path = os.path.join(cache_dir, cache_filename)
+    tmp_path = cache_path + '.tmp'
+    with io.open(tmp_path, 'w', encoding='utf-8') as fp:
+        json.dump(entries, fp, separators=(',', ':'))
+    os.replace(tmp_path, cache_path)
+
+
+def add_features(font, fea_paths, cache_dir=None):
+    """
+    Compiles feature files into a font. 'fea_paths' is a dictionary whose
+    keys are table tags ('GSUB' or 'GPOS') and whose values are feature file
+    paths (or None).
+    When 'cache_dir' is set the compiled tables are stored in it, and they're
+    reused for as long as the feature files and the glyph order don't change.
+    """
+    fea_paths = {tag: path for tag, path in fea_paths.items() if path}
+    if not cache_dir:
+        for tag, fea_path in fea_paths.items():
+            addOpenTypeFeatures(font, fea_path, tables=[tag])
+        return
+
+    disk_cache = read_cache_file(cache_dir, FEA_CACHE_FILENAME)
+    cache_entries = {}
+    glyph_order = font.getGlyphOrder()
+    reused = False
+    for tag, fea_path in fea_paths.items():
+        cache_key = get_features_cache_key(fea_path, glyph_order)
+        entry = disk_cache.get(tag)
+        if entry and entry['key'] == cache_key:
+            # the data is None if the feature file didn't make a table
+            if entry['data'] is not None:
+                table = newTable(tag)
+                table.decompile(base64.b64decode(entry['data']), font)
+                font[tag] = table
+            cache_entries[tag] = entry
+            reused = True
+            log.info(f'Features cache: reused the {tag} table.')
+            continue
+
+        addOpenTypeFeatures(font, fea_path, tables=[tag])
+        table_data = None
+        if tag in font:
+            table_data = base64.b64encode(
+                font[tag].compile(font)).decode('ascii')
+        cache_entries[tag] = {'key': cache_key, 'data': table_data}
+        log.info(f'Features cache: compiled the {tag} table.')
+
+    # addOpenTypeFeatures() also sets the OS/2 table's usMaxContext value
+    if reused and 'OS/2' in font:
+        font['OS/2'].usMaxContext = maxCtxFont(font)
+
+    if cache_entries != disk_cache:
+        write_cache_file(cache_dir, FEA_CACHE_FILENAME, cache_entries)
+
+
+def get_ligature_components(gname):
+    """
+    Takes the (untrimmed) glyph name of an emoji sequence, and returns the
+    glyph names of the characters the sequence is made of, e.g.
+    'u1f441_200d_1f5e8' -> ['u1f441', 'ZWJ', 'u1f5e8'].
+    Returns None if the glyph name isn't the name of a sequence.
+    """
+    if not RE_SEQUENCE.match(gname):
+        return None
+    cdpts = gname[1:].lower().split('_')  # trim leading 'u'
+    # the file names of tag sequences (e.g. subdivision flags) omit the
+    # CANCEL TAG that terminates the sequence
+    if cdpts[-1] in TAG_LAT_LETTR and cdpts[-1] != CANCEL_TAG:
+        cdpts.append(CANCEL_TAG)
+    return ['ZWJ' if cdpt == '200d' else f'u{cdpt}' for cdpt in cdpts]
+
+
+def make_ligatures(gname_sources, glyph_set):
+    """
+    Makes the ligature substitutions of the emoji sequences.
+    'gname_sources' is a list of tuples of the untrimmed and the final glyph
+    names, and 'glyph_set' is the set of glyph names in the font.
+    Returns a dictionary whose keys are tuples of component glyph names and
+    whose values are ligature glyph names.
+    """
+    ligatures = {}
+    if UNKNOWN_FLAG_GNAME in glyph_set:
+        reg_ind_gnames = [f'u{cdpt}' for cdpt in REG_IND_LETTR
+                          if f'u{cdpt}' in glyph_set]
+        for pair in itertools.product(reg_ind_gnames, repeat=2):
+            ligatures[pair] = UNKNOWN_FLAG_GNAME
+
+    for source_gname, gname in gname_sources:
+        components = get_ligature_components(source_gname)
+        if not components:
+            continue
+        missing = [comp for comp in components if comp not in glyph_set]
+        if missing:
+            log.warning("Skipped the ligature of glyph '{}'. The font has no "
+                        "glyphs named {}.".format(gname, ', '.join(missing)))
+            continue
+        # the flags override the unknown flag
+        ligatures[tuple(components)] = gname
+    return ligatures
+
+
+def build_gsub_table(ligatures):
+    """
+    Makes a GSUB table with a 'ccmp' feature for the default script and
+    language system, whose single lookup contains the ligature substitutions.
+    The ligatures are grouped by their first glyph in the LigatureSubst
+    subtable.
+    """
+    lookup = buildLookup([buildLigatureSubstSubtable(ligatures)])
+
+    feature = otTables.Feature()
+    feature.FeatureParams = None
+    feature.LookupListIndex = [0]
+    feature.LookupCount = 1
+    feature_record = otTables.FeatureRecord()
+    feature_record.FeatureTag = 'ccmp'
+    feature_record.Feature = feature
+
+    lang_sys = otTables.DefaultLangSys()
+    lang_sys.LookupOrder = None
+    lang_sys.ReqFeatureIndex = 0xFFFF
+    lang_sys.FeatureIndex = [0]
+    lang_sys.FeatureCount = 1
+    script = otTables.Script()
+    script.DefaultLangSys = lang_sys
+    script.LangSysRecord = []
+    script.LangSysCount = 0
+    script_record = otTables.ScriptRecord()
+    script_record.ScriptTag = 'DFLT'
+    script_record.Script = script
+
+    gsub = otTables.GSUB()
+    gsub.Version = 0x00010000
+    gsub.ScriptList = otTables.ScriptList()
+    gsub.ScriptList.ScriptRecord = [script_record]
+    gsub.ScriptList.ScriptCount = 1
+    gsub.FeatureList = otTables.FeatureList()
+    gsub.FeatureList.FeatureRecord = [feature_record]
+    gsub.FeatureList.FeatureCount = 1
+    gsub.LookupList = otTables.LookupList()
+    gsub.LookupList.Lookup = [lookup]
+    gsub.LookupList.LookupCount = 1
+
+    gsub_table = newTable('GSUB')
+    gsub_table.table = gsub
+    return gsub_table
+
+
+def get_glyph_aliases(file_paths, alias_index=None):
+    """
+    Groups the SVG files that resolve to the same source file (see
+    alias_index.py), and picks the file whose glyph stands in for the rest of
+    its group. That's the source file itself if it's in 'file_paths',
+    otherwise the group's first file.
+    Returns a dictionary of the paths of the other files of each group to the
+    path of the picked file.
+    """
+    if alias_index is None:
+        alias_index = AliasIndex(file_paths)
+    glyph_aliases = {}
+    for source_path, fpaths in alias_index.get_groups().items():
+        if len(fpaths) < 2:
+            continue
+        canon_fpath = next(
+            (fpath for fpath in fpaths if not alias_index.is_alias(fpath)),
+            fpaths[0])
+        glyph_aliases.update(
+            (fpath, canon_fpath) for fpath in fpaths if fpath != canon_fpath)
+    return glyph_aliases
+
+
+def collect_layout_glyphs(obj, glyph_set, gnames, ligatures):
+    """
+    Walks the objects of a GSUB or GPOS table, and adds the names of the
+    glyphs they refer to to the set 'gnames'. The output glyphs of ligature
+    substitutions are left out; their Ligature objects are appended to the
+    list 'ligatures' instead.
+    """
+    if isinstance(obj, str):
+        if obj in glyph_set:
+            gnames.add(obj)
+    elif isinstance(obj, dict):
+        for key, value in obj.items():
+            collect_layout_glyphs(key, glyph_set, gnames, ligatures)
+            collect_layout_glyphs(value, glyph_set, gnames, ligatures)
+    elif isinstance(obj, (list, tuple)):
+        for item in obj:
+            collect_layout_glyphs(item, glyph_set, gnames, ligatures)
+    elif isinstance(obj, otTables.Ligature):
+        collect_layout_glyphs(obj.Component, glyph_set, gnames, ligatures)
+        ligatures.append(obj)
+    elif isinstance(obj, otTables.BaseTable):
+        for value in vars(obj).values():
+            collect_layout_glyphs(value, glyph_set, gnames, ligatures)
+
+
+def merge_alias_glyphs(font, glyph_aliases):
+    """
+    Removes the glyphs of a font made by build_font() that are keys of
+    'glyph_aliases', a dictionary of glyph names to the names of the glyphs
+    with the same outline. Their code points (including the variation
+    sequences) and the ligature substitutions that output them are mapped to
+    the glyphs that stand in for them.
+    Glyphs that are input to a GSUB or GPOS lookup (e.g. the skin tone
+    modifiers) are kept, because merging them would change the sequences the
+    lookups apply to.
+    Returns the number of glyphs removed.
+    """
+    glyph_set = set(font.getGlyphOrder())
+    input_gnames, ligatures = set(), []
+    for tag in ('GSUB', 'GPOS'):
+        if tag in font:
+            font[tag].ensureDecompiled()
+            collect_layout_glyphs(
+                font[tag].table, glyph_set, input_gnames, ligatures)
+    glyph_aliases = {gname: canon_gname
+                     for gname, canon_gname in glyph_aliases.items()
+                     if gname not in input_gnames}
+    if not glyph_aliases:
+        return 0
+
+    for subtable in font['cmap'].tables:
+        if subtable.format == 14:
+            for uvs_lst in subtable.uvsDict.values():
+                uvs_lst[:] = [(uni_int, glyph_aliases.get(gname, gname))
+                              for uni_int, gname in uvs_lst]
+        else:
+            subtable.cmap = {uni_int: glyph_aliases.get(gname, gname)
+                             for uni_int, gname in subtable.cmap.items()}
+    for ligature in ligatures:
+        ligature.LigGlyph = glyph_aliases.get(
+            ligature.LigGlyph, ligature.LigGlyph)
+
+    glyph_order = [gname for gname in font.getGlyphOrder()
+                   if gname not in glyph_aliases]
+    font.setGlyphOrder(glyph_order)
+    top_dict = font['CFF '].cff.topDictIndex[0]
+    top_dict.charset = glyph_order
+    for gname in glyph_aliases:
+        del top_dict.CharStrings.charStrings[gname]
+        del font['hmtx'].metrics[gname]
+        del font['vmtx'].metrics[gname]
+    return len(glyph_aliases)
 
 
 def draw_notdef(pen):
@@ -161,71 +634,126 @@ def get_trimmed_glyph_name(gname, num):
     return gname[:31 - len(suffix)] + suffix
 
 
-def make_font(file_paths, out_dir, revision, gsub_path, gpos_path, uvs_lst):
+def build_font(file_paths, revision, gsub_path, gpos_path, uvs_lst,
+               jobs=1, cache_dir=None, profiler=None, ligatures=False,
+               alias_glyphs=False, keep_glyphs=(), aliases_files=()):
+    """
+    Makes the BW font from a list of SVG file paths. When 'ligatures' is True
+    the GSUB table is made from the glyph names, instead of 'gsub_path'.
+    When 'alias_glyphs' is True the glyphs of aliased SVG files are merged
+    into a single glyph (see merge_alias_glyphs), except for the glyphs whose
+    untrimmed names are in 'keep_glyphs'. The copies listed in the
+    'aliases_files' are treated as aliases too (see alias_index.py).
+    Returns the font as a TTFont object, which hasn't been saved yet.
+    """
+    if profiler is None:
+        profiler = BuildProfiler('make_bw_font', enabled=False)
     cmap, gorder, validated_fpaths = {}, deque(), []
+    gname_sources = []  # (untrimmed glyph name, glyph name) tuples
     # build glyph order
-    for fpath in file_paths:
-        # derive glyph name from file name
-        gname = os.path.splitext(os.path.basename(fpath))[0]  # trim extension
-        # validate glyph name
-        if not glyph_name_is_valid(gname, fpath):
-            continue
-        # skip any duplicates and 'space'
-        if gname in gorder or gname == 'space':
-            log.warning("Skipped file '{}'. The glyph name derived from it "
-                        "is either a duplicate or 'space'.".format(fpath))
-            continue
-        # limit the length of glyph name to 31 chars
-        if len(gname) > 31:
-            num = 0
-            trimmed_gname = get_trimmed_glyph_name(gname, num)
-            while trimmed_gname in gorder:
-                num += 1
-                trimmed_gname = get_trimmed_glyph_name(trimmed_gname, num)
-            gorder.append(trimmed_gname)
-            log.warning("Glyph name '{}' was trimmed to 31 characters: "
-                        "'{}'".format(gname, trimmed_gname))
-        else:
-            gorder.append(gname)
-        validated_fpaths.append(fpath)
-
-        # add to cmap
-        if RE_UNICODE.match(gname):
-            uni_int = int(gname[1:], 16)  # trim leading 'u'
-            cmap[uni_int] = gname
+    with profiler.phase('bw.name_validation'):
+        for fpath in file_paths:
+            # derive glyph name from file name
+            gname = os.path.splitext(os.path.basename(fpath))[0]
+            # validate glyph name
+            if not glyph_name_is_valid(gname, fpath):
+                continue
+            # skip any duplicates and 'space'
+            if gname in gorder or gname == 'space':
+                log.warning("Skipped file '{}'. The glyph name derived from "
+                            "it is either a duplicate or 'space'.".format(
+                                fpath))
+                continue
+            # limit the length of glyph name to 31 chars
+            if len(gname) > 31:
+                num = 0
+                trimmed_gname = get_trimmed_glyph_name(gname, num)
+                while trimmed_gname in gorder:
+                    num += 1
+                    trimmed_gname = get_trimmed_glyph_name(trimmed_gname, num)
+                gorder.append(trimmed_gname)
+                log.warning("Glyph name '{}' was trimmed to 31 characters: "
+                            "'{}'".format(gname, trimmed_gname))
+            else:
+                gorder.append(gname)
+            validated_fpaths.append(fpath)
+            gname_sources.append((gname, gorder[-1]))
+
+            # add to cmap
+            if RE_UNICODE.match(gname):
+                uni_int = int(gname[1:], 16)  # trim leading 'u'
+                cmap[uni_int] = gname
 
     fb = FontBuilder(UPM, isTTF=False)
     fb.font['head'].fontRevision = float(revision)
     fb.font['head'].lowestRecPPEM = 12
 
-    cs_dict = {}
-    cs_cache = {}
-    for i, svg_file_path in enumerate(validated_fpaths):
-        svg_file_realpath = os.path.realpath(svg_file_path)
+    # aliases (symlinks, their stand-ins, or listed copies) resolve to the
+    # same source file, so each outline only needs to be converted once
+    alias_index = AliasIndex(validated_fpaths, aliases_files)
+    realpaths = [alias_index.get_source(fpath) for fpath in validated_fpaths]
+    unique_realpaths = list(dict.fromkeys(realpaths))
+
+    glyph_aliases = {}  # key: glyph name; value: name of the glyph kept
+    if alias_glyphs:
+        fpath_gnames = dict(zip(validated_fpaths, gname_sources))
+        for fpath, canon_fpath in get_glyph_aliases(
+                validated_fpaths, alias_index).items():
+            source_gname, gname = fpath_gnames[fpath]
+            if source_gname not in keep_glyphs:
+                glyph_aliases[gname] = fpath_gnames[canon_fpath][1]
 
-        if svg_file_realpath not in cs_cache:
-            svg_size = get_svg_size(svg_file_realpath)
-            if svg_size is None:
-                cs_dict[gorder[i]] = SPACE_CHARSTRING
-                continue
+    cs_cache = {}
+    bounds_cache = {}
+    disk_cache = {}
+    cache_keys = {}
+    if cache_dir:
+        with profiler.phase('bw.cache_read'):
+            disk_cache = read_cache_file(cache_dir, CS_CACHE_FILENAME)
+            for svg_file_realpath, _, data in read_files(unique_realpaths):
+                cache_key = get_charstring_cache_key(svg_file_realpath, data)
+                cache_keys[svg_file_realpath] = cache_key
+                entry = disk_cache.get(cache_key)
+                if entry:
+                    cs_cache[svg_file_realpath] = T2CharString(
+                        program=entry['program'])
+                    bounds_cache[svg_file_realpath] = entry['bounds']
+
+    missed_realpaths = [rpath for rpath in unique_realpaths
+                        if rpath not in cs_cache]
+    # the SVG files are parsed and drawn in one go (possibly in several
+    # processes), so the time of each step is measured per file
+    with profiler.phase('bw.svg_parse_and_charstring_build'):
+        results = draw_svg_glyphs(missed_realpaths, jobs)
+    for svg_file_realpath, result in zip(missed_realpaths, results):
+        if result is None:
+            cs_cache[svg_file_realpath] = None
+            continue
+        cs, bounds, (parse_time, build_time) = result
+        cs_cache[svg_file_realpath] = cs
+        bounds_cache[svg_file_realpath] = bounds
+        profiler.add_file_time(svg_file_realpath, 'bw.svg_parse', parse_time)
+        profiler.add_file_time(
+            svg_file_realpath, 'bw.charstring_build', build_time)
+    if cache_dir:
+        log.info('Charstring cache: {} hits, {} misses.'.format(
+            len(unique_realpaths) - len(missed_realpaths),
+            len(missed_realpaths)))
 
-            pen = T2CharStringPen(EMOJI_H_ADV, None)
-            svg = SVGPath(svg_file_realpath,
-                          transform=(EMOJI_SIZE / svg_size, 0, 0,
-                                     -EMOJI_SIZE / svg_size,
-                                     (EMOJI_H_ADV * .5) - (EMOJI_SIZE * .5),
-                                     EMOJI_H_ADV * ABOVE_BASELINE))
-            svg.draw(pen)
-            cs = pen.getCharString()
-            cs_cache[svg_file_realpath] = cs
-        else:
-            cs = cs_cache.get(svg_file_realpath)
+    cs_dict = {}
+    gname_realpaths = {}
+    for gname, svg_file_realpath in zip(gorder, realpaths):
+        cs = cs_cache[svg_file_realpath]
+        cs_dict[gname] = cs if cs is not None else SPACE_CHARSTRING
+        gname_realpaths[gname] = svg_file_realpath
 
-        cs_dict[gorder[i]] = cs
+    glyphs_bounds = {gname: bounds_cache.get(svg_file_realpath)
+                     for gname, svg_file_realpath in gname_realpaths.items()}
 
     # add '.notdef', 'space' and zero-width joiner
-    pen = T2CharStringPen(EMOJI_H_ADV, None)
+    pen = BoundsT2CharStringPen(EMOJI_H_ADV, None)
     draw_notdef(pen)
+    glyphs_bounds['.notdef'] = pen.getBounds()
     gorder.extendleft(reversed(['.notdef', 'space', 'ZWJ']))
     cs_dict.update({'.notdef': pen.getCharString(),
                     'space': SPACE_CHARSTRING,
@@ -252,24 +780,43 @@ def make_font(file_paths, out_dir, revision, gsub_path, gpos_path, uvs_lst):
                           'FamilyName': FAMILY_NAME,
                           'Weight': STYLE_NAME}, cs_dict, {})
 
-    glyphs_bearings = {}
-    for gname, cs in cs_dict.items():
-        gbbox = cs.calcBounds(None)
-        if gbbox:
-            xmin, ymin, _, ymax = gbbox
-            if ymax > ASCENT:
-                log.warning("Top of glyph '{}' may get clipped. "
-                            "Glyph's ymax={}; Font's ascent={}".format(
-                                gname, ymax, ASCENT))
-            if ymin < DESCENT:
-                log.warning("Bottom of glyph '{}' may get clipped. "
-                            "Glyph's ymin={}; Font's descent={}".format(
-                                gname, ymin, DESCENT))
-            lsb = xmin
-            tsb = EMOJI_V_ADV - ymax - EMOJI_H_ADV * (1 - ABOVE_BASELINE)
-            glyphs_bearings[gname] = (lsb, tsb)
-        else:
-            glyphs_bearings[gname] = (0, 0)
+    if cache_dir:
+        with profiler.phase('bw.cache_write'):
+            cache_entries = {}
+            for svg_file_realpath in unique_realpaths:
+                cs = cs_cache[svg_file_realpath]
+                if cs is None:
+                    continue
+                cache_entries[cache_keys[svg_file_realpath]] = {
+                    'program': cs.program,
+                    'bounds': bounds_cache[svg_file_realpath],
+                }
+            evicted = len(set(disk_cache).difference(cache_entries))
+            write_cache_file(cache_dir, CS_CACHE_FILENAME, cache_entries)
+        log.info('Charstring cache: stored {} entries, evicted {}.'.format(
+            len(cache_entries), evicted))
+
+    # the bounds were collected while the glyphs were drawn (or read from
+    # the cache); glyphs without bounds are blank
+    with profiler.phase('bw.bounds'):
+        glyphs_bearings = {}
+        for gname in cs_dict:
+            gbbox = glyphs_bounds.get(gname)
+            if gbbox:
+                xmin, ymin, _, ymax = gbbox
+                if ymax > ASCENT:
+                    log.warning("Top of glyph '{}' may get clipped. "
+                                "Glyph's ymax={}; Font's ascent={}".format(
+                                    gname, ymax, ASCENT))
+                if ymin < DESCENT:
+                    log.warning("Bottom of glyph '{}' may get clipped. "
+                                "Glyph's ymin={}; Font's descent={}".format(
+                                    gname, ymin, DESCENT))
+                lsb = xmin
+                tsb = EMOJI_V_ADV - ymax - EMOJI_H_ADV * (1 - ABOVE_BASELINE)
+                glyphs_bearings[gname] = (lsb, tsb)
+            else:
+                glyphs_bearings[gname] = (0, 0)
 
     h_metrics = {}
     v_metrics = {}
@@ -311,19 +858,84 @@ def make_font(file_paths, out_dir, revision, gsub_path, gpos_path, uvs_lst):
                 sTypoAscender=ASCENT, sTypoDescender=DESCENT,
                 sCapHeight=ASCENT, ulCodePageRange1=(1 << 1))  # set 1st CP bit
 
-    if gsub_path:
-        addOpenTypeFeatures(fb.font, gsub_path, tables=['GSUB'])
-
-    if gpos_path:
-        addOpenTypeFeatures(fb.font, gpos_path, tables=['GPOS'])
+    with profiler.phase('bw.features'):
+        if ligatures:
+            fb.font['GSUB'] = build_gsub_table(
+                make_ligatures(gname_sources, set(gorder)))
+            gsub_path = None
+        add_features(fb.font, {'GSUB': gsub_path, 'GPOS': gpos_path},
+                     cache_dir)
+        if ligatures:
+            fb.font['OS/2'].usMaxContext = maxCtxFont(fb.font)
+
+    if glyph_aliases:
+        # the features are compiled before the glyphs are merged, so the
+        # feature files can keep referring to the aliased glyphs
+        with profiler.phase('bw.alias_glyphs'):
+            removed = merge_alias_glyphs(fb.font, glyph_aliases)
+        log.info('Merged {} aliased glyphs into the glyphs they alias; {} '
+                 'were kept for being input to a lookup.'.format(
+                     removed, len(glyph_aliases) - removed))
 
     fb.setupPost(isFixedPitch=1,
                  underlinePosition=UNDERLINE_POSITION,
                  underlineThickness=UNDERLINE_THICKNESS)
 
     fb.setupDummyDSIG()
+    return fb.font
 
-    fb.save(os.path.join(out_dir, '{}.otf'.format(PS_NAME)))
+
+def get_font_data(font):
+    """
+    Compiles a TTFont object and returns the font file's data.
+    """
+    buf = io.BytesIO()
+    font.save(buf)
+    return buf.getvalue()
+
+
+def subroutinize_font_data(font_data):
+    """
+    Subroutinizes the CFF table of an OT-CFF font using cffsubr, which bundles
+    AFDKO's tx. The outlines don't change, so the font's bounding boxes aren't
+    recalculated and the other tables are copied as they are.
+    Returns the data of the subroutinized font.
+    """
+    font = TTFont(io.BytesIO(font_data), recalcBBoxes=False)
+    cff_size = len(font.reader['CFF '])
+    cffsubr.subroutinize(font)
+    subr_font_data = get_font_data(font)
+    font.close()
+
+    with TTFont(io.BytesIO(subr_font_data)) as subr_font:
+        subr_cff_size = len(subr_font.reader['CFF '])
+    log.info('Subroutinized the CFF table: {} bytes before, {} bytes after '
+             '({:.1%} smaller).'.format(
+                 cff_size, subr_cff_size, 1 - subr_cff_size / cff_size))
+    return subr_font_data
+
+
+def make_font(file_paths, out_dir, revision, gsub_path, gpos_path, uvs_lst,
+              jobs=1, cache_dir=None, profiler=None, subroutinize=False,
+              ligatures=False, alias_glyphs=False, aliases_files=()):
+    if profiler is None:
+        profiler = BuildProfiler('make_bw_font', enabled=False)
+    font = build_font(file_paths, revision, gsub_path, gpos_path, uvs_lst,
+                      jobs, cache_dir, profiler, ligatures, alias_glyphs,
+                      aliases_files=aliases_files)
+    font_path = os.path.join(out_dir, '{}.otf'.format(PS_NAME))
+    if not subroutinize:
+        with profiler.phase('bw.save'):
+            font.save(font_path)
+        return font_path
+
+    with profiler.phase('bw.compile'):
+        font_data = get_font_data(font)
+    with profiler.phase('bw.subroutinize'):
+        font_data = subroutinize_font_data(font_data)
+    with io.open(font_path, 'wb') as fp:
+        fp.write(font_data)
+    return font_path
 
 
 def parse_uvs_file(file_path):
@@ -383,6 +995,17 @@ def validate_file_path(path_str):
     return normalize_path(path_str)
 
 
+def validate_job_count(jobs_str):
+    try:
+        jobs = int(jobs_str)
+    except ValueError:
+        jobs = 0
+    if jobs < 1:
+        raise argparse.ArgumentTypeError(
+            "The number of jobs must be a positive integer.")
+    return jobs
+
+
 def normalize_path(path_str):
     return os.path.normpath(path_str)
 
@@ -424,11 +1047,26 @@ def main(args=None):
         type=validate_revision_number,
         default='0.001',
     )
-    parser.add_argument(
+    gsub_group = parser.add_mutually_exclusive_group()
+    gsub_group.add_argument(
         '--gsub',
         help='path to GSUB features file',
         type=validate_file_path,
     )
+    gsub_group.add_argument(
+        '--ligatures',
+        action='store_true',
+        help=('make the ligature substitutions of the emoji sequences from '
+              'the glyph names, instead of reading them from a GSUB features '
+              'file')
+    )
+    parser.add_argument(
+        '--alias-glyphs',
+        action='store_true',
+        help=('store the outline of aliased SVG files once, by mapping the '
+              'code points and ligatures of the aliases to the glyph of '
+              'their source file')
+    )
     parser.add_argument(
         '--gpos',
         help='path to GPOS features file',
@@ -439,6 +1077,54 @@ def main(args=None):
         help='path to Unicode Variation Sequences file',
         type=validate_file_path,
     )
+    parser.add_argument(
+        '-j',
+        '--jobs',
+        help=('number of worker processes used for converting the SVG '
+              'files. Defaults to %(default)s'),
+        type=validate_job_count,
+        default=1,
+    )
+    parser.add_argument(
+        '--cache-dir',
+        help=('directory for caching the converted glyph outlines and the '
+              'compiled feature tables between builds. Only the SVG files '
+              'that changed are converted again.'),
+        metavar='DIR',
+        type=normalize_path,
+    )
+    parser.add_argument(
+        '--subroutinize',
+        action='store_true',
+        help='subroutinize the font (requires the cffsubr package)'
+    )
+    parser.add_argument(
+        '--web-formats',
+        help=('comma-separated list of web font formats (woff2, woff) to '
+              'also save the font in. WOFF2 requires the brotli package'),
+        metavar='FORMATS',
+        type=validate_web_formats,
+        default=[],
+    )
+    parser.add_argument(
+        '--aliases-file',
+        help=('text file listing the aliases of the SVG files (e.g. '
+              'emoji_bw_aliases.txt). The aliases that are copies of their '
+              'source file are processed once, like symbolic links. Can be '
+              'used more than once'),
+        metavar='FILE',
+        type=validate_file_path,
+        action='append',
+        dest='aliases_files',
+        default=[],
+    )
+    parser.add_argument(
+        '--profile',
+        help=('path to a JSON file for saving the wall time and peak memory '
+              'of each build phase, and the slowest SVG files'),
+        metavar='FILE',
+        type=normalize_path,
+    )
     opts = parser.parse_args(args)
 
     if not opts.verbose:
@@ -449,11 +1135,23 @@ def main(args=None):
         level = "DEBUG"
     logging.basicConfig(level=level)
 
+    if opts.subroutinize and cffsubr is None:
+        log.error("Subroutinizing the font requires the 'cffsubr' package. "
+                  "Install it with 'pip install cffsubr'.")
+        return 1
+
+    if not check_web_formats(opts.web_formats):
+        return 1
+
+    profiler = BuildProfiler('make_bw_font', enabled=bool(opts.profile))
+
     file_paths = []
-    for in_dir in opts.in_dirs:
-        fpaths = sorted(glob.iglob(os.path.join(in_dir, '*.[sS][vV][gG]')))
-        file_paths.extend(fpaths)
-        log.info(f"Found {len(fpaths)} SVG files in '{in_dir}'.")
+    with profiler.phase('bw.glob'):
+        for in_dir in opts.in_dirs:
+            fpaths = sorted(
+                glob.iglob(os.path.join(in_dir, '*.[sS][vV][gG]')))
+            file_paths.extend(fpaths)
+            log.info(f"Found {len(fpaths)} SVG files in '{in_dir}'.")
 
     if not len(file_paths):
         log.error('Failed to match any SVG files.')
@@ -476,7 +1174,15 @@ def main(args=None):
     else:
         out_dir = opts.in_dirs[0]
 
-    make_font(file_paths, out_dir, opts.revision, opts.gsub, opts.gpos, uvs)
+    font_path = make_font(
+        file_paths, out_dir, opts.revision, opts.gsub, opts.gpos, uvs,
+        opts.jobs, opts.cache_dir, profiler, opts.subroutinize,
+        opts.ligatures, opts.alias_glyphs, opts.aliases_files)
+    if opts.web_formats:
+        with profiler.phase('bw.web_fonts'):
+            rows = make_web_fonts([(font_path, None)], opts.web_formats)
+        print(format_web_fonts_table(rows))
+    profiler.save(opts.profile)
 
 
 if __name__ == "__main__":
@@ -4,20 +4,38 @@
 Adds an SVG table to an OpenType font.
 """
 import argparse
+from concurrent.futures import ProcessPoolExecutor
 from decimal import Decimal
 import glob
+import gzip
+import hashlib
 import io
+import json
 import logging
 import os
 import re
+import struct
 import sys
+import time
 
 from fontTools.ttLib import TTFont, TTLibError, newTable
 
+try:
+    import zopfli.gzip
+except ImportError:
+    zopfli = None
+
+from alias_index import AliasIndex
+from build_profile import BuildProfiler
+from file_loader import get_text, read_files
 from make_bw_font import (
     VENDOR, glyph_name_is_valid, get_trimmed_glyph_name, parse_viewbox_values,
-    validate_dir_path, validate_file_path, validate_revision_number,
+    validate_dir_path, validate_file_path, validate_job_count,
+    validate_revision_number, normalize_path,
     UPM, EMOJI_SIZE, EMOJI_H_ADV, ASCENT, RE_VIEWBOX)
+from web_fonts import (
+    check_web_formats, format_web_fonts_table, make_web_fonts,
+    validate_web_formats)
 
 FAMILY_NAME = 'Noto Color Emoji SVG'
 FULL_NAME = FAMILY_NAME
@@ -36,14 +54,62 @@ def norm_float(value):
 VIEWBOX_SCALE = norm_float(UPM / EMOJI_SIZE)
 
 
+# Stores the hashes of the SVG files used for making the SVG table, so that
+# later builds can reuse the documents of the files that did not change
+SVG_MANIFEST_SUFFIX = '.svgdocs.json'
+SVG_MANIFEST_SETTINGS = [UPM, EMOJI_SIZE, EMOJI_H_ADV, ASCENT]
+
 RE_XMLHEADER = re.compile(r"<\?xml .*\?>")
 RE_SVGID = re.compile(r"<svg[^>]+?(id=\".*?\").+?>", re.DOTALL)
 RE_ENABLEBKGD = re.compile(r"( enable-background=[\"|\'][new\d, ]+[\"|\'])")
 RE_SPACEBTWEEN = re.compile(r">\s+<", re.MULTILINE)
+RE_SVGROOT = re.compile(r"<svg\b[^>]*(?<!/)>")
+RE_SVGSTART = re.compile(r"<svg\b[^>]*>")
+RE_ROOTID = re.compile(r"(?<=\s)id=[\"\'][^\"\']*[\"\']")
+RE_ROOTVIEWBOX = re.compile(r"\s*viewBox=[\"|\']([-\d,. ]+)[\"|\']")
+RE_SVGCLEANUP = re.compile(
+    r"<\?xml .*\?>"                                # XML header
+    r"| enable-background=[\"|\'][new\d, ]+[\"|\']"  # 'enable-background'
+    r"|(?<=>)\s+(?=<)")                            # space between elements
+# 'gzip' is the zlib deflate encoder; 'zopfli' makes smaller gzip streams,
+# but is much slower
+COMPRESSORS = ('gzip', 'zopfli')
+DEFAULT_COMPRESSION_LEVEL = 9
+# Sizes of the SVG table's header (version, document index offset, reserved),
+# of its number of document index entries, and of each entry (start and end
+# GIDs, document offset and length)
+SVG_HEADER_SIZE = struct.calcsize('>HLL')
+SVG_DOC_COUNT_SIZE = struct.calcsize('>H')
+SVG_DOC_ENTRY_SIZE = struct.calcsize('>HHLL')
+
+RE_GLYPHID = re.compile(r"\s*id=\"glyph\d+\"")
+RE_SHAREDWRAPPERS = re.compile(r"(?:<g id=\"glyph\d+\">)+")
 
 log = logging.getLogger('make_svg_font')
 
 
+def get_adjusted_viewbox(vb_str, svg_file_path, scale=1):
+    """
+    Takes the string of a viewBox's values.
+    Returns a string of new viewBox values that scale and shift the artwork.
+    """
+    min_x, min_y, width, height = parse_viewbox_values(vb_str)
+
+    if width != height:
+        log.error("The 'viewBox' is not square. "
+                  f"width: {width}; height: {height}; {svg_file_path}")
+
+    svg_size = width
+
+    x_shift = norm_float(
+        (EMOJI_SIZE - EMOJI_H_ADV) / EMOJI_SIZE * svg_size / 2)
+
+    y_shift = norm_float(svg_size * ASCENT / EMOJI_SIZE)
+
+    return '{} {} {} {}'.format(
+        min_x + x_shift, min_y + y_shift, width * scale, height * scale)
+
+
 def adjust_viewbox(svg_str, svg_file_path, scale=1):
     """
     Changes viewbox's values.
@@ -56,22 +122,10 @@ def adjust_viewbox(svg_str, svg_file_path, scale=1):
     """
     vb = RE_VIEWBOX.search(svg_str)
     if vb:
-        min_x, min_y, width, height = parse_viewbox_values(vb.group(3))
-
-        if width != height:
-            log.error("The 'viewBox' is not square. "
-                      f"width: {width}; height: {height}; {svg_file_path}")
-
-        svg_size = width
-
-        x_shift = norm_float(
-            (EMOJI_SIZE - EMOJI_H_ADV) / EMOJI_SIZE * svg_size / 2)
-
-        y_shift = norm_float(svg_size * ASCENT / EMOJI_SIZE)
-
-        new_svg_header = '{} viewBox="{} {} {} {}"{}'.format(
-            vb.group(1), min_x + x_shift, min_y + y_shift,
-            width * scale, height * scale, vb.group(4))
+        new_svg_header = '{} viewBox="{}"{}'.format(
+            vb.group(1),
+            get_adjusted_viewbox(vb.group(3), svg_file_path, scale),
+            vb.group(4))
 
         svg_str = RE_VIEWBOX.sub(new_svg_header, svg_str)
 
@@ -100,83 +154,533 @@ def set_svg_id(data, gid):
     return re.sub('<svg', '<svg id="glyph{}"'.format(gid), data)
 
 
-def add_svg_table(font_path, file_paths, compress_table=False):
-    gnames_dict = {}  # key: glyph name; value: SVG file path
-    for fpath in file_paths:
-        gname = os.path.splitext(os.path.basename(fpath))[0]  # trim extension
-        # validate glyph name
-        if not glyph_name_is_valid(gname, fpath):
-            continue
-        # skip any duplicates and 'space'
-        if gname in gnames_dict or gname == 'space':
-            log.warning("Skipped file '{}'. The glyph name derived from it "
-                        "is either a duplicate or 'space'".format(fpath))
-            continue
-        # limit the length of glyph name to 31 chars
-        if len(gname) > 31:
-            num = 0
-            trimmed_gname = get_trimmed_glyph_name(gname, num)
-            while trimmed_gname in gnames_dict:
-                num += 1
-                trimmed_gname = get_trimmed_glyph_name(trimmed_gname, num)
-            gnames_dict[trimmed_gname] = fpath
-            log.warning("Glyph name '{}' was trimmed to 31 characters: "
-                        "'{}'".format(gname, trimmed_gname))
+def normalize_svg_doc(svg_str, gid, svg_file_path, scale=1):
+    """
+    Does the work of set_svg_id(), adjust_viewbox() and clean_svg_doc()
+    with a single scan of the document. The XML header, 'enable-background'
+    parameters and white space between elements are removed by one regex
+    substitution; then the start tag of the root 'svg' element gets its id
+    and viewBox values replaced.
+    """
+    svg_str = RE_SVGCLEANUP.sub('', svg_str)
+
+    root = RE_SVGSTART.search(svg_str)
+    if not root:
+        return svg_str.strip()
+
+    root_tag = root.group()
+    id_attr = 'id="glyph{}"'.format(gid)
+    root_tag, found = RE_ROOTID.subn(id_attr, root_tag, count=1)
+    if not found:
+        root_tag = '<svg {}{}'.format(id_attr, root_tag[len('<svg'):])
+
+    vb = RE_ROOTVIEWBOX.search(root_tag)
+    if vb:
+        root_tag = '{} viewBox="{}"{}'.format(
+            root_tag[:vb.start()],
+            get_adjusted_viewbox(vb.group(1), svg_file_path, scale),
+            root_tag[vb.end():])
+
+    return ''.join(
+        [svg_str[:root.start()], root_tag, svg_str[root.end():]]).strip()
+
+
+def set_doc_glyph_id(data, gid):
+    """
+    Replaces the glyph id of the root 'svg' element of a document made by
+    normalize_svg_doc(), so that the document can be used for another glyph.
+    """
+    root = RE_SVGSTART.search(data)
+    if not root:
+        return data
+    root_tag = re.sub(r'id="glyph\d+"', 'id="glyph{}"'.format(gid),
+                      root.group(), count=1)
+    return ''.join([data[:root.start()], root_tag, data[root.end():]])
+
+
+def get_svg_manifest_path(svg_font_path):
+    return os.path.splitext(svg_font_path)[0] + SVG_MANIFEST_SUFFIX
+
+
+def get_compression_settings(compressor, level):
+    """
+    Returns the compression settings recorded in the manifest, as a list.
+    The level only applies to 'gzip'.
+    """
+    return [compressor, level if compressor == 'gzip' else None]
+
+
+def read_svg_doc_list(font):
+    """
+    Reads the documents of the SVG table of a font opened from a file,
+    without decompiling the table (fontTools takes quadratic time for that).
+    Returns a list of (data, start GID, end GID, stored data) tuples. 'data'
+    is the uncompressed document, and 'stored data' are its bytes as stored
+    in the font, possibly compressed.
+    """
+    table_data = font.reader['SVG ']
+    _, index_offset = struct.unpack_from('>HL', table_data)
+    entries_count, = struct.unpack_from('>H', table_data, index_offset)
+    doc_list = []
+    for i in range(entries_count):
+        start_gid, end_gid, doc_offset, doc_length = struct.unpack_from(
+            '>HHLL', table_data, index_offset + 2 + i * 12)
+        doc_offset += index_offset
+        stored_data = table_data[doc_offset:doc_offset + doc_length]
+        if stored_data.startswith(b'\x1f\x8b'):
+            doc_bytes = gzip.decompress(stored_data)
         else:
-            gnames_dict[gname] = fpath
+            doc_bytes = stored_data
+        doc_list.append(
+            (doc_bytes.decode('utf-8'), start_gid, end_gid, stored_data))
+    return doc_list
 
-    font = TTFont(font_path)
-    svg_docs_dict = {}
-    for gname, svg_file_path in gnames_dict.items():
-        try:
-            gid = font.getGlyphID(gname)
-        except KeyError:
-            log.warning('Could not find a glyph named {} in the font'
-                        ''.format(gname))
+
+def read_previous_svg_docs(svg_font_path, compression=None):
+    """
+    Reads the SVG table of a previously built font, and the manifest that
+    was saved along with it. 'compression' is the list returned by
+    get_compression_settings() for the current build, or None if its
+    documents aren't compressed.
+    Returns a dictionary of glyph names to (file hash, GID) lists, a
+    dictionary of GIDs to SVG documents, and a dictionary of SVG documents
+    to their compressed data. The latter is only filled in if the previous
+    build compressed its documents with the same settings. All are empty if
+    the previous build can't be used.
+    """
+    manifest_path = get_svg_manifest_path(svg_font_path)
+    if not (os.path.isfile(svg_font_path) and os.path.isfile(manifest_path)):
+        log.info('No previous build found. Making all SVG documents.')
+        return {}, {}, {}
+
+    with io.open(manifest_path, encoding='utf-8') as fp:
+        manifest = json.load(fp)
+    if manifest.get('settings') != SVG_MANIFEST_SETTINGS:
+        log.info('The settings of the previous build differ. '
+                 'Making all SVG documents.')
+        return {}, {}, {}
+
+    with TTFont(svg_font_path, lazy=True) as font:
+        if 'SVG ' not in font.reader:
+            return {}, {}, {}
+        doc_list = read_svg_doc_list(font)
+    reuse_compressed = (compression is not None and
+                        manifest.get('compression') == compression)
+    docs_dict = {}
+    compressed_docs = {}
+    for data, start_gid, end_gid, stored_data in doc_list:
+        if reuse_compressed:
+            compressed_docs[data] = stored_data
+        for gid in range(start_gid, end_gid + 1):
+            docs_dict[gid] = unshare_svg_doc(data, gid)
+    return manifest['docs'], docs_dict, compressed_docs
+
+
+def write_svg_manifest(svg_font_path, docs_manifest, compression=None):
+    """
+    Saves the manifest of a color font. It's saved along with every build,
+    so that it always matches the font. 'compression' is the list returned
+    by get_compression_settings(), or None.
+    """
+    manifest_path = get_svg_manifest_path(svg_font_path)
+    with io.open(manifest_path, 'w', encoding='utf-8') as fp:
+        json.dump({'settings': SVG_MANIFEST_SETTINGS, 'docs': docs_manifest,
+                   'compression': compression},
+                  fp, indent=0, sort_keys=True)
+
+
+def get_gid_ranges(gids):
+    """
+    Takes a sorted list of GIDs.
+    Returns a list of (start GID, end GID) tuples of consecutive GIDs.
+    """
+    ranges = []
+    for gid in gids:
+        if ranges and ranges[-1][1] == gid - 1:
+            ranges[-1] = (ranges[-1][0], gid)
+        else:
+            ranges.append((gid, gid))
+    return ranges
+
+
+def share_svg_docs(svg_docs_dict):
+    """
+    Takes a dictionary of GIDs to (SVG document, GID, GID) tuples.
+    Combines the documents that differ only by their glyph ID into a single
+    document. The root 'svg' element keeps the id of the first glyph, and the
+    contents are wrapped in nested 'g' elements with the ids of the other
+    glyphs. Consecutive GIDs sharing a document are combined into a range.
+
+    Returns a list of SVG documents sorted by GID, and the number of bytes
+    saved.
+    """
+    groups = {}  # key: document without glyph id; value: list of GIDs
+    for gid in sorted(svg_docs_dict):
+        doc_key = RE_GLYPHID.sub('', svg_docs_dict[gid][0], count=1)
+        groups.setdefault(doc_key, []).append(gid)
+
+    svg_docs_list = []
+    saved_bytes = 0
+    for gids in groups.values():
+        data = svg_docs_dict[gids[0]][0]
+        root = RE_SVGROOT.search(data)
+        if len(gids) == 1 or not (root and data.endswith('</svg>')):
+            svg_docs_list.extend(svg_docs_dict[gid] for gid in gids)
             continue
 
-        with io.open(svg_file_path, encoding='utf-8') as fp:
-            svg_item_data = fp.read()
+        wrappers = ''.join('<g id="glyph{}">'.format(gid) for gid in gids[1:])
+        shared_data = ''.join([
+            data[:root.end()], wrappers, data[root.end():-len('</svg>')],
+            '</g>' * (len(gids) - 1), '</svg>'])
+        saved_bytes += sum(
+            len(svg_docs_dict[gid][0].encode('utf-8')) for gid in gids
+        ) - len(shared_data.encode('utf-8'))
+        log.debug('Glyphs {} share an SVG document'.format(gids))
 
-        # Set id value
-        svg_item_data = set_svg_id(svg_item_data, gid)
+        for start_gid, end_gid in get_gid_ranges(gids):
+            svg_docs_list.append((shared_data, start_gid, end_gid))
 
-        # Scale and shift the artwork, by adjusting its viewBox
-        svg_item_data = adjust_viewbox(
-            svg_item_data, svg_file_path, VIEWBOX_SCALE)
+    svg_docs_list.sort(key=lambda doc: doc[1])
+    return svg_docs_list, saved_bytes
 
-        # Clean SVG document
-        svg_item_data = clean_svg_doc(svg_item_data)
 
-        svg_docs_dict[gid] = (svg_item_data.strip(), gid, gid)
+def unshare_svg_doc(data, gid):
+    """
+    Does the reverse of share_svg_docs() for a single glyph.
+    Returns the SVG document of the glyph with the given GID.
+    """
+    root = RE_SVGROOT.search(data)
+    wrappers = root and RE_SHAREDWRAPPERS.match(data, root.end())
+    if not wrappers:
+        return data
+    wrappers_count = wrappers.group(0).count('<g ')
+    root_tag = re.sub(r'id="glyph\d+"', 'id="glyph{}"'.format(gid),
+                      data[:root.end()], count=1)
+    body = data[wrappers.end():-len('</svg>') - len('</g>') * wrappers_count]
+    return '{}{}</svg>'.format(root_tag, body)
+
+
+def compress_svg_doc(data, compressor='gzip',
+                     level=DEFAULT_COMPRESSION_LEVEL):
+    """
+    Compresses an SVG document the same way fontTools does when the SVG
+    table is compiled, using 'compressor' (see COMPRESSORS). 'level' only
+    applies to 'gzip'. The document is only compressed if that makes it
+    smaller.
+    Returns the data of the document as bytes.
+    """
+    doc_bytes = data.encode('utf-8')
+    if compressor == 'zopfli':
+        gzipped = zopfli.gzip.compress(doc_bytes)
+    else:
+        bytes_io = io.BytesIO()
+        with gzip.GzipFile(None, 'w', fileobj=bytes_io, compresslevel=level,
+                           mtime=0) as gzipper:
+            gzipper.write(doc_bytes)
+        gzipped = bytes_io.getvalue()
+    return gzipped if len(gzipped) < len(doc_bytes) else doc_bytes
+
+
+def compress_svg_docs(svg_docs_list, compressor='gzip',
+                      level=DEFAULT_COMPRESSION_LEVEL, jobs=1,
+                      prev_compressed_docs=None):
+    """
+    Compresses the data of a list of SVG documents (see compress_svg_doc).
+    Documents shared by several glyphs are only compressed once. When 'jobs'
+    is greater than 1 the documents are spread over that many worker
+    processes. 'prev_compressed_docs' is a dictionary of documents to their
+    data compressed with the same settings by a previous build; those
+    documents aren't compressed again.
+    Returns a new list of (data, start GID, end GID) tuples, whose data is
+    bytes.
+    """
+    # key: document data; value: compressed data
+    compressed_docs = {}
+    if prev_compressed_docs:
+        for data, _, _ in svg_docs_list:
+            if data in prev_compressed_docs:
+                compressed_docs[data] = prev_compressed_docs[data]
+        log.info('Reused the compressed data of {} SVG documents.'.format(
+            len(compressed_docs)))
+    unique_docs = list(dict.fromkeys(
+        data for data, _, _ in svg_docs_list if data not in compressed_docs))
+    compressors = [compressor] * len(unique_docs)
+    levels = [level] * len(unique_docs)
+    if jobs > 1 and len(unique_docs) > 1:
+        chunksize = max(1, len(unique_docs) // (jobs * 4))
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(
+                compress_svg_doc, unique_docs, compressors, levels,
+                chunksize=chunksize))
+    else:
+        results = list(map(compress_svg_doc, unique_docs, compressors,
+                           levels))
+
+    compressed_docs.update(zip(unique_docs, results))
+    return [(compressed_docs[data], start_gid, end_gid)
+            for data, start_gid, end_gid in svg_docs_list]
+
+
+def get_compression_report(svg_docs_list, compressed_list, seconds,
+                           compressor, level):
+    """
+    Returns a dictionary with the settings and the time of the compression,
+    the total sizes of the unique SVG documents before and after compression,
+    the size of the SVG table compiled from them, and the sizes of each
+    document. The table size is counted the way fontTools compiles the table,
+    which stores identical documents once.
+    """
+    docs = []
+    sizes = {}  # key: document data; value: (size, compressed size)
+    for (data, start_gid, end_gid), (compressed_data, _, _) in zip(
+            svg_docs_list, compressed_list):
+        doc_sizes = (len(data.encode('utf-8')), len(compressed_data))
+        sizes[data] = doc_sizes
+        docs.append({'start_gid': start_gid, 'end_gid': end_gid,
+                     'size': doc_sizes[0], 'compressed_size': doc_sizes[1]})
+    return {
+        'compressor': compressor,
+        'level': level if compressor == 'gzip' else None,
+        'time': round(seconds, 6),
+        'documents': len(sizes),
+        'size': sum(size for size, _ in sizes.values()),
+        'compressed_size': sum(size for _, size in sizes.values()),
+        'table_size': (SVG_HEADER_SIZE + SVG_DOC_COUNT_SIZE
+                       + SVG_DOC_ENTRY_SIZE * len(compressed_list)
+                       + sum(len(data) for data in {
+                           data for data, _, _ in compressed_list})),
+        'docs': docs,
+    }
+
+
+def get_svg_font_path(font, font_path):
+    """
+    Returns the path of the color font made from the font at 'font_path'.
+    """
+    ext = '.ttf' if 'glyf' in font else '.otf'
+    svg_font_filename = '{}{}'.format(PS_NAME, ext)
+    return os.path.join(os.path.dirname(font_path), svg_font_filename)
+
+
+def set_svg_table(font, file_paths, compress_table=False, share_docs=True,
+                  prev_build=None, profiler=None, compressor='gzip',
+                  compression_level=DEFAULT_COMPRESSION_LEVEL, jobs=1,
+                  report_path=None, aliases_files=()):
+    """
+    Makes an SVG table from a list of SVG file paths and adds it to a font.
+    'prev_build' is the tuple returned by read_previous_svg_docs(); the SVG
+    documents of the files that didn't change, and their compressed data,
+    are taken from it.
+    When 'compress_table' is True the documents are compressed using
+    'jobs' processes (see compress_svg_docs), and a report of the
+    compression is saved at 'report_path', if given. The copies listed in
+    the 'aliases_files' are treated as aliases (see alias_index.py).
+    Returns a dictionary of glyph names to (file hash, GID) lists, or None if
+    none of the SVG files could be added to the font.
+    """
+    if profiler is None:
+        profiler = BuildProfiler('make_svg_font', enabled=False)
+    gnames_dict = {}  # key: glyph name; value: SVG file path
+    with profiler.phase('color.name_validation'):
+        for fpath in file_paths:
+            # derive glyph name from file name
+            gname = os.path.splitext(os.path.basename(fpath))[0]
+            # validate glyph name
+            if not glyph_name_is_valid(gname, fpath):
+                continue
+            # skip any duplicates and 'space'
+            if gname in gnames_dict or gname == 'space':
+                log.warning("Skipped file '{}'. The glyph name derived from "
+                            "it is either a duplicate or 'space'".format(
+                                fpath))
+                continue
+            # limit the length of glyph name to 31 chars
+            if len(gname) > 31:
+                num = 0
+                trimmed_gname = get_trimmed_glyph_name(gname, num)
+                while trimmed_gname in gnames_dict:
+                    num += 1
+                    trimmed_gname = get_trimmed_glyph_name(trimmed_gname, num)
+                gnames_dict[trimmed_gname] = fpath
+                log.warning("Glyph name '{}' was trimmed to 31 characters: "
+                            "'{}'".format(gname, trimmed_gname))
+            else:
+                gnames_dict[gname] = fpath
+
+    prev_manifest, prev_docs_dict, prev_compressed_docs = (
+        prev_build or ({}, {}, {}))
+
+    svg_docs_dict = {}
+    docs_manifest = {}
+    reused = 0
+    with profiler.phase('color.svg_normalize'):
+        # aliases (symlinks, their stand-ins, or listed copies) resolve to
+        # the same source file, which is read and normalized once for all of
+        # its glyphs
+        alias_index = AliasIndex(gnames_dict.values(), aliases_files)
+        source_glyphs = {}  # key: source file path; value: (name, GID) list
+        missing_glyphs = []  # (glyph name, source file path) tuples
+        glyph_ids = font.getReverseGlyphMap()
+        for gname, svg_file_path in gnames_dict.items():
+            source_path = alias_index.get_source(svg_file_path)
+            gid = glyph_ids.get(gname)
+            if gid is None:
+                missing_glyphs.append((gname, source_path))
+                continue
+            source_glyphs.setdefault(source_path, []).append((gname, gid))
+        for gname, source_path in missing_glyphs:
+            # the BW font was made with merged alias glyphs (see
+            # make_bw_font.merge_alias_glyphs), and the artwork is still used
+            # by another glyph
+            if source_path in source_glyphs:
+                log.debug("Glyph {} isn't in the font, but its artwork is "
+                          "used by glyph {}".format(
+                              gname, source_glyphs[source_path][0][0]))
+                continue
+            log.warning('Could not find a glyph named {} in the font'
+                        ''.format(gname))
+
+        # the SVG files are read ahead of their normalization by a pool of
+        # threads
+        for svg_file_path, _, data in read_files(source_glyphs):
+            start = time.perf_counter()
+            svg_item_data = get_text(svg_file_path, data)
+
+            file_hash = hashlib.sha256(
+                svg_item_data.encode('utf-8')).hexdigest()
+            svg_doc = None
+            for gname, gid in source_glyphs[svg_file_path]:
+                docs_manifest[gname] = [file_hash, gid]
+
+                # Reuse the document of the previous build if neither the SVG
+                # file nor the glyph's GID changed
+                if prev_manifest.get(gname) == [file_hash, gid] and (
+                        gid in prev_docs_dict):
+                    svg_docs_dict[gid] = (prev_docs_dict[gid], gid, gid)
+                    reused += 1
+                elif svg_doc is None:
+                    # Set id value, scale and shift the artwork by adjusting
+                    # its viewBox, and clean the SVG document
+                    svg_doc = normalize_svg_doc(
+                        svg_item_data, gid, svg_file_path, VIEWBOX_SCALE)
+                    svg_docs_dict[gid] = (svg_doc, gid, gid)
+                else:
+                    svg_docs_dict[gid] = (
+                        set_doc_glyph_id(svg_doc, gid), gid, gid)
+
+            if svg_doc is not None:
+                profiler.add_file_time(
+                    svg_file_path, 'color.svg_normalize',
+                    time.perf_counter() - start)
 
     # Don't modify the input font if there's no SVG data
     if not svg_docs_dict:
         log.warning('None of the SVG files found could be added to the font')
-        font.close()
         return
 
-    # Make a list of the SVG documents sorted by GID
-    svg_docs_list = sorted(svg_docs_dict.values(), key=lambda doc: doc[1])
+    with profiler.phase('color.svg_table_assembly'):
+        if share_docs:
+            svg_docs_list, saved_bytes = share_svg_docs(svg_docs_dict)
+            log.info('Sharing identical SVG documents saved {} bytes.'.format(
+                     saved_bytes))
+        else:
+            # Make a list of the SVG documents sorted by GID
+            svg_docs_list = sorted(
+                svg_docs_dict.values(), key=lambda doc: doc[1])
+
+    if compress_table:
+        # The documents are compressed ahead of compiling the table, which
+        # then keeps them as they are
+        with profiler.phase('color.compression'):
+            start = time.perf_counter()
+            compressed_list = compress_svg_docs(
+                svg_docs_list, compressor, compression_level, jobs,
+                prev_compressed_docs)
+            seconds = time.perf_counter() - start
+        report = get_compression_report(
+            svg_docs_list, compressed_list, seconds, compressor,
+            compression_level)
+        log.info('Compressed {} SVG documents from {} to {} bytes with {} '
+                 'in {:.2f} s.'.format(
+                     report['documents'], report['size'],
+                     report['compressed_size'], compressor, seconds))
 
     svg_table = newTable('SVG ')
-    svg_table.compressed = compress_table
-    svg_table.docList = svg_docs_list
+    svg_table.compressed = False
+    svg_table.docList = compressed_list if compress_table else svg_docs_list
     svg_table.colorPalettes = None
     font['SVG '] = svg_table
 
-    ext = '.ttf' if 'glyf' in font else '.otf'
-    svg_font_filename = '{}{}'.format(PS_NAME, ext)
-    svg_font_path = os.path.join(os.path.dirname(font_path), svg_font_filename)
-    font.save(svg_font_path)
-    font.close()
+    if compress_table and report_path:
+        with io.open(report_path, 'w', encoding='utf-8') as fp:
+            json.dump(report, fp, indent=2)
+        log.info("Saved compression report '{}'.".format(report_path))
+
+    if prev_build is not None:
+        log.info('Reused {} SVG documents from the previous build; '
+                 'made {}.'.format(reused, len(svg_docs_dict) - reused))
+    return docs_manifest
+
+
+def load_font(font_path):
+    """
+    Opens a font whose tables are only read when they're accessed, and whose
+    bounding boxes aren't recalculated when it's saved (the outlines don't
+    change). This way the tables that aren't modified, and the CFF
+    charstrings, are saved as they are.
+    """
+    return TTFont(font_path, lazy=True, recalcBBoxes=False)
+
+
+def add_svg_table(font, font_path, file_paths, revision=None,
+                  compress_table=False, incremental=False, share_docs=True,
+                  profiler=None, compressor='gzip',
+                  compression_level=DEFAULT_COMPRESSION_LEVEL, jobs=1,
+                  report_path=None, aliases_files=()):
+    """
+    Adds an SVG table to a font opened with load_font(), updates its names,
+    and saves it as the color font next to 'font_path'. When 'revision' is
+    None, the revision number of the font is kept.
+    Returns the path of the color font, or None if none of the SVG files
+    could be added.
+    """
+    if profiler is None:
+        profiler = BuildProfiler('make_svg_font', enabled=False)
+    svg_font_path = get_svg_font_path(font, font_path)
+    if revision is None:
+        revision = get_font_revision_number(font)
+
+    compression = None
+    if compress_table:
+        compression = get_compression_settings(compressor, compression_level)
+    prev_build = None
+    if incremental:
+        with profiler.phase('color.previous_build'):
+            prev_build = read_previous_svg_docs(svg_font_path, compression)
+
+    docs_manifest = set_svg_table(
+        font, file_paths, compress_table, share_docs, prev_build, profiler,
+        compressor, compression_level, jobs, report_path, aliases_files)
+    if docs_manifest is None:
+        return
+    set_font_names(font, revision)
+
+    with profiler.phase('color.save'):
+        font.save(svg_font_path)
+    # the manifest is refreshed even without 'incremental', so that a later
+    # incremental build never reads the manifest of an older font
+    write_svg_manifest(svg_font_path, docs_manifest, compression)
     log.info("Wrote '{}' containing {} SVG glyphs".format(
-             os.path.basename(svg_font_path), len(svg_docs_list)))
+             os.path.basename(svg_font_path), len(docs_manifest)))
     return svg_font_path
 
 
-def update_tables(font_path, revision):
-    font = TTFont(font_path)
+def set_font_names(font, revision):
+    """
+    Sets the revision number and the names of the color font.
+    """
+    # the revision number may be a Decimal, which the CFF table can't store
+    revision = str(revision)
     font['head'].fontRevision = float(revision)
     if 'CFF ' in font:
         cff = font['CFF '].cff
@@ -198,25 +702,22 @@ def update_tables(font_path, revision):
     name_table = font['name']
     for nameID, string in name_strings.items():
         name_table.setName(string, nameID, 3, 1, 0x409)  # Windows only
-    font.save(font_path)
-    font.close()
-    log.info('Updated font tables.')
 
 
-def get_font_revision_number(font_path):
-    with TTFont(font_path) as font:
-        font_rev = font['head'].fontRevision
+def get_font_revision_number(font):
+    font_rev = font['head'].fontRevision
     return Decimal(font_rev).quantize(Decimal('1.000'))
 
 
-def validate_font_path(path_str):
-    valid_file_path = validate_file_path(path_str)
+def validate_compression_level(level_str):
     try:
-        TTFont(valid_file_path).close()
-    except TTLibError as err:
+        level = int(level_str)
+    except ValueError:
+        level = 0
+    if not 1 <= level <= 9:
         raise argparse.ArgumentTypeError(
-            'Input file is n{}'.format(err.args[0][1:]))
-    return valid_file_path
+            "The compression level must be an integer from 1 to 9.")
+    return level
 
 
 def main(args=None):
@@ -234,6 +735,50 @@ def main(args=None):
         dest='compress_table',
         help='compress the SVG table'
     )
+    parser.add_argument(
+        '--compressor',
+        help=("encoder used for compressing the SVG documents with -z. "
+              "'zopfli' makes a smaller table, but is much slower, and "
+              "requires the zopfli package. Defaults to %(default)s"),
+        choices=COMPRESSORS,
+        default='gzip',
+    )
+    parser.add_argument(
+        '--compression-level',
+        help=("compression level of the 'gzip' compressor, from 1 (fastest) "
+              "to 9 (smallest). Defaults to %(default)s"),
+        type=validate_compression_level,
+        default=DEFAULT_COMPRESSION_LEVEL,
+    )
+    parser.add_argument(
+        '-j',
+        '--jobs',
+        help=('number of worker processes used for compressing the SVG '
+              'documents. Defaults to %(default)s'),
+        type=validate_job_count,
+        default=1,
+    )
+    parser.add_argument(
+        '--compression-report',
+        help=('path to a JSON file for saving the time of the compression, '
+              'and the sizes of the SVG table and of each document'),
+        metavar='FILE',
+        type=normalize_path,
+    )
+    parser.add_argument(
+        '-i',
+        '--incremental',
+        action='store_true',
+        help=('reuse the SVG documents of the previous build for the SVG '
+              'files that did not change')
+    )
+    parser.add_argument(
+        '--no-shared-docs',
+        action='store_false',
+        dest='share_docs',
+        help=('store one SVG document per glyph, even if several glyphs '
+              'have identical artwork')
+    )
     parser.add_argument(
         '-r',
         '--revision',
@@ -252,7 +797,35 @@ def main(args=None):
         'in_font',
         help='input font',
         metavar='FONT',
-        type=validate_font_path,
+        type=validate_file_path,
+    )
+    parser.add_argument(
+        '--web-formats',
+        help=('comma-separated list of web font formats (woff2, woff) to '
+              'also save the color font in. WOFF2 requires the brotli '
+              'package'),
+        metavar='FORMATS',
+        type=validate_web_formats,
+        default=[],
+    )
+    parser.add_argument(
+        '--aliases-file',
+        help=('text file listing the aliases of the SVG files (e.g. '
+              'emoji_color_aliases.txt). The aliases that are copies of '
+              'their source file are processed once, like symbolic links. '
+              'Can be used more than once'),
+        metavar='FILE',
+        type=validate_file_path,
+        action='append',
+        dest='aliases_files',
+        default=[],
+    )
+    parser.add_argument(
+        '--profile',
+        help=('path to a JSON file for saving the wall time and peak memory '
+              'of each build phase, and the slowest SVG files'),
+        metavar='FILE',
+        type=normalize_path,
     )
     opts = parser.parse_args(args)
 
@@ -264,26 +837,50 @@ def main(args=None):
         level = "DEBUG"
     logging.basicConfig(level=level)
 
+    if opts.compress_table and opts.compressor == 'zopfli' and (
+            zopfli is None):
+        log.error("The 'zopfli' compressor requires the 'zopfli' package. "
+                  "Install it with 'pip install zopfli'.")
+        return 1
+
+    if not check_web_formats(opts.web_formats):
+        return 1
+
+    profiler = BuildProfiler('make_svg_font', enabled=bool(opts.profile))
+
+    # the font is opened once, and read and saved in a single pass
+    try:
+        with profiler.phase('color.font_load'):
+            font = load_font(opts.in_font)
+    except TTLibError as err:
+        parser.error('Input file is n{}'.format(err.args[0][1:]))
+
     file_paths = []
-    for in_dir in opts.in_dirs:
-        fpaths = sorted(glob.iglob(os.path.join(in_dir, '*.[sS][vV][gG]')))
-        file_paths.extend(fpaths)
-        log.info(f"Found {len(fpaths)} SVG files in '{in_dir}'.")
+    with profiler.phase('color.glob'):
+        for in_dir in opts.in_dirs:
+            fpaths = sorted(
+                glob.iglob(os.path.join(in_dir, '*.[sS][vV][gG]')))
+            file_paths.extend(fpaths)
+            log.info(f"Found {len(fpaths)} SVG files in '{in_dir}'.")
 
     if not len(file_paths):
         log.error('Failed to match any SVG files.')
+        font.close()
         return 1
 
-    font_path = add_svg_table(opts.in_font, file_paths, opts.compress_table)
+    font_path = add_svg_table(
+        font, opts.in_font, file_paths, opts.revision, opts.compress_table,
+        opts.incremental, opts.share_docs, profiler, opts.compressor,
+        opts.compression_level, opts.jobs, opts.compression_report,
+        opts.aliases_files)
+    font.close()
     if not font_path:
         return 1
-
-    if not opts.revision:
-        revision = get_font_revision_number(opts.in_font)
-    else:
-        revision = opts.revision
-
-    update_tables(font_path, revision)
+    if opts.web_formats:
+        with profiler.phase('color.web_fonts'):
+            rows = make_web_fonts([(font_path, None)], opts.web_formats)
+        print(format_web_fonts_table(rows))
+    profiler.save(opts.profile)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,674 @@
+"""
+Splits the BW and the color fonts into chunks of emoji groups, and saves a
+CSS file with an @font-face rule for each chunk. The unicode-range of each
+rule lists the code points of its chunk, so that browsers only download the
+chunks of the emoji a page uses.
+
+The groups and subgroups of the emoji are read from Unicode's emoji-test.txt
+file. Each ligature substitution is kept in a single chunk, along with
+copies of the glyphs it substitutes (e.g. the chunk of the 'man cook'
+sequence also has the 'man' and 'cooking' glyphs). The glyphs that join or
+modify the emoji of several groups (e.g. the zero-width joiner and the skin
+tone modifiers) are copied into every chunk, but the ligatures made with
+each of them are gathered in a single chunk. The unicode-range of a chunk
+lists the code points of its own glyphs and of the glyphs its ligatures are
+made of, so that browsers can pick one chunk for a whole emoji sequence,
+and a page with a zero-width joiner sequence doesn't download every chunk.
+"""
+import argparse
+import io
+import logging
+import os
+import sys
+
+from fontTools import subset
+from fontTools.ttLib import TTFont, newTable
+
+from make_bw_font import (
+    FAMILY_NAME as BW_FAMILY_NAME, get_font_data, normalize_path,
+    validate_file_path, validate_job_count)
+from make_svg_font import (
+    FAMILY_NAME as COLOR_FAMILY_NAME, compress_svg_docs, set_doc_glyph_id,
+    share_svg_docs, unshare_svg_doc)
+from web_fonts import (
+    check_web_formats, format_web_fonts_table, get_web_font_path,
+    make_web_fonts, validate_web_formats)
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+EMOJI_TEST_PATH = os.path.join(ROOT_DIR, 'test', 'emoji-test.txt')
+CHUNKS_DIRNAME = 'chunks'
+CSS_FILENAME = 'emoji.css'
+
+# Code points that join or modify other emoji, and aren't displayed on their
+# own: space, no-break space, zero-width joiner, variation selectors and tags
+JOINER_CDPTS = frozenset(
+    [0x20, 0xA0, 0x200D, 0xFE0E, 0xFE0F] + list(range(0xE0020, 0xE0080)))
+VARIATION_SELECTORS = (0xFE0E, 0xFE0F)
+ZWJ_CDPT = 0x200D
+# Status of the emoji components (skin tones and hair styles) in
+# emoji-test.txt
+COMPONENT_STATUS = 'component'
+FULLY_QUALIFIED_STATUS = 'fully-qualified'
+# Formats of the src descriptor of @font-face, in order of preference
+CSS_FORMATS = (('woff2', 'woff2'), ('woff', 'woff'), ('otf', 'opentype'))
+
+log = logging.getLogger('split_fonts')
+
+
+def parse_emoji_test_file(file_path):
+    """
+    Parses Unicode's 'emoji-test.txt' file.
+    Returns a list of tuples in the form
+    (group, subgroup, code points, status), in the order of the file.
+    'code points' is a list of integers.
+    """
+    with io.open(file_path, encoding='utf-8') as fp:
+        lines = fp.read().splitlines()
+
+    emoji_list = []
+    group = subgroup = None
+    for line in lines:
+        line = line.strip()
+        if line.startswith('# group:'):
+            group = line.split(':', 1)[1].strip()
+        elif line.startswith('# subgroup:'):
+            subgroup = line.split(':', 1)[1].strip()
+        elif line and not line.startswith('#'):
+            cdpts_str, status_emoname = line.split(';')
+            status = status_emoname.split('#')[0].strip()
+            cdpts = [int(cdpt, 16) for cdpt in cdpts_str.split()]
+            emoji_list.append((group, subgroup, cdpts, status))
+    return emoji_list
+
+
+def get_ligatures(font):
+    """
+    Returns a dictionary of the ligature substitutions of a font's GSUB
+    table. Its keys are tuples of component glyph names, and its values are
+    ligature glyph names.
+    """
+    ligatures = {}
+    if 'GSUB' not in font:
+        return ligatures
+    for lookup in font['GSUB'].table.LookupList.Lookup:
+        for subtable in lookup.SubTable:
+            if lookup.LookupType == 7:
+                subtable = subtable.ExtSubTable
+            for first_gname, ligs in getattr(
+                    subtable, 'ligatures', {}).items():
+                for lig in ligs:
+                    ligatures[(first_gname, *lig.Component)] = lig.LigGlyph
+    return ligatures
+
+
+def get_connector_glyphs(cmap, emoji_list):
+    """
+    Returns the names of the glyphs that are copied into every chunk: those
+    of the joiner code points and of the emoji components.
+    """
+    cdpts = set(JOINER_CDPTS)
+    cdpts.update(cdpt for _, _, emoji_cdpts, status in emoji_list
+                 if status == COMPONENT_STATUS for cdpt in emoji_cdpts)
+    return {cmap[cdpt] for cdpt in cdpts if cdpt in cmap}
+
+
+def resolve_emoji_glyph(cdpts, cmap, ligatures):
+    """
+    Returns the name of the glyph displayed for an emoji's code points, or
+    None if the font has no glyph for it. The variation selectors are
+    dropped if the font doesn't include them in its ligatures.
+    """
+    for emoji_cdpts in (cdpts, [cdpt for cdpt in cdpts
+                                if cdpt not in VARIATION_SELECTORS]):
+        gnames = [cmap.get(cdpt) for cdpt in emoji_cdpts]
+        if not gnames or None in gnames:
+            continue
+        if len(gnames) == 1:
+            return gnames[0]
+        if tuple(gnames) in ligatures:
+            return ligatures[tuple(gnames)]
+    return None
+
+
+def get_variation_glyphs(font):
+    """
+    Returns a list of tuples of the glyph names of a code point and of its
+    variation sequences' glyph, for the variation sequences that don't use
+    the code point's default glyph.
+    """
+    cmap = font.getBestCmap()
+    variation_glyphs = []
+    for subtable in font['cmap'].tables:
+        if subtable.format != 14:
+            continue
+        for uvs_lst in subtable.uvsDict.values():
+            variation_glyphs.extend(
+                (cmap[uni_int], gname) for uni_int, gname in uvs_lst
+                if gname is not None and uni_int in cmap)
+    return variation_glyphs
+
+
+def get_glyph_sections(font, connectors, emoji_list):
+    """
+    Finds the emoji group and subgroup of each glyph of a font, except for
+    the connector glyphs. A glyph that isn't listed in 'emoji_list' gets the
+    section of the first ligature substitution (or variation sequence) it's
+    part of, e.g. the regional indicator letters get the section of the
+    first flag; otherwise it gets the last section of 'emoji_list'.
+    Returns a dictionary of glyph names to (group, subgroup) tuples.
+    """
+    cmap = font.getBestCmap()
+    ligatures = get_ligatures(font)
+    gnames = [gname for gname in font.getGlyphOrder()
+              if gname not in connectors and gname != '.notdef']
+    glyph_sections = {}
+    for group, subgroup, cdpts, _ in emoji_list:
+        gname = resolve_emoji_glyph(cdpts, cmap, ligatures)
+        if gname is not None and gname not in connectors:
+            glyph_sections.setdefault(gname, (group, subgroup))
+
+    related_glyphs = [components + (lig_gname,)
+                      for components, lig_gname in ligatures.items()]
+    related_glyphs.extend(get_variation_glyphs(font))
+    unlisted = set(gnames).difference(glyph_sections)
+    while unlisted:
+        listed_count = len(unlisted)
+        for rel_gnames in related_glyphs:
+            section = next((glyph_sections[gname] for gname in rel_gnames
+                            if gname in glyph_sections), None)
+            if section is None:
+                continue
+            for gname in unlisted.intersection(rel_gnames):
+                glyph_sections[gname] = section
+                unlisted.remove(gname)
+        if len(unlisted) == listed_count:
+            break
+
+    if unlisted:
+        log.warning('{} glyphs are not related to the emoji of the emoji '
+                    'test file, and were added to its last subgroup: '
+                    '{}'.format(len(unlisted), ', '.join(sorted(unlisted))))
+        last_section = emoji_list[-1][:2]
+        glyph_sections.update((gname, last_section) for gname in unlisted)
+    return {gname: glyph_sections[gname] for gname in gnames}
+
+
+def partition_weights(weights, count):
+    """
+    Splits a list of weights into 'count' runs of consecutive items, such
+    that the heaviest run is as light as possible.
+    Returns a list of (start, end) index tuples.
+    """
+    size = len(weights)
+    sums = [0]
+    for weight in weights:
+        sums.append(sums[-1] + weight)
+    # best[k][i]: the lightest heaviest run of the first i weights split
+    # into k runs; cuts[k][i]: the start of the last of those runs
+    best = [[None] * (size + 1) for _ in range(count + 1)]
+    cuts = [[0] * (size + 1) for _ in range(count + 1)]
+    best[0][0] = 0
+    for k in range(1, count + 1):
+        for i in range(k, size + 1):
+            for j in range(k - 1, i):
+                if best[k - 1][j] is None:
+                    continue
+                heaviest = max(best[k - 1][j], sums[i] - sums[j])
+                if best[k][i] is None or heaviest < best[k][i]:
+                    best[k][i] = heaviest
+                    cuts[k][i] = j
+    runs = []
+    end = size
+    for k in range(count, 0, -1):
+        start = cuts[k][end]
+        runs.append((start, end))
+        end = start
+    return runs[::-1]
+
+
+def get_section_name(group, subgroup, by_group):
+    return group if by_group else '{} / {}'.format(group, subgroup)
+
+
+def gather_connector_ligatures(chunk_gnames, connectors, glyph_inputs):
+    """
+    Moves the ligature glyphs made with each connector glyph into the chunk
+    that has the most of them, so that the connector's code point is in the
+    unicode-range of a single chunk. A ligature made with several connectors
+    goes with the connector that has the most ligatures. 'chunk_gnames' is a
+    list of the sets of glyph names of the chunks, which are updated.
+    """
+    connector_ligs = {}  # key: connector glyph name; value: set of ligatures
+    for gname, inputs in glyph_inputs.items():
+        for connector in connectors.intersection(inputs):
+            connector_ligs.setdefault(connector, set()).add(gname)
+    moved = set()
+    for connector in sorted(connector_ligs,
+                            key=lambda gname: (-len(connector_ligs[gname]),
+                                               gname)):
+        ligs = connector_ligs[connector].difference(moved)
+        target = max(chunk_gnames, key=lambda gnames: len(ligs & gnames))
+        for gnames in chunk_gnames:
+            gnames.difference_update(ligs)
+        target.update(ligs)
+        moved.update(ligs)
+
+
+def make_chunks(font, emoji_list, chunk_count):
+    """
+    Splits the glyphs of a font into 'chunk_count' chunks of consecutive emoji
+    groups, or of consecutive subgroups if there are fewer groups than
+    chunks. The chunks have about the same number of glyphs of their own.
+    The ligatures made with connector glyphs are then gathered (see
+    gather_connector_ligatures). A chunk also gets copies of the glyphs that
+    its ligature substitutions and variation sequences are made of, wherever
+    those belong.
+    Returns a list of dictionaries containing the names of the sections
+    that the chunk's own glyphs belong to ('sections'), the glyph names
+    ('gnames') and the code points ('unicodes') of each chunk, and the set of
+    connector glyph names that are copied into every chunk. The connectors
+    are only in the 'gnames' and 'unicodes' of the chunks whose ligatures
+    are made with them.
+    """
+    cmap = font.getBestCmap()
+    connectors = get_connector_glyphs(cmap, emoji_list)
+    glyph_sections = get_glyph_sections(font, connectors, emoji_list)
+
+    # the chunks are made of whole groups if there are enough of them
+    by_group = chunk_count <= len(
+        {group for group, _ in glyph_sections.values()})
+    section_gnames = {}  # key: section name; value: list of glyph names
+    for group, subgroup, _, _ in emoji_list:
+        section_gnames.setdefault(
+            get_section_name(group, subgroup, by_group), [])
+    for gname, section in glyph_sections.items():
+        section_gnames[get_section_name(*section, by_group)].append(gname)
+    # the sections with glyphs, in the order of the emoji test file
+    section_order = [section for section, gnames in section_gnames.items()
+                     if gnames]
+
+    if chunk_count > len(section_order):
+        log.warning('The glyphs can be split into {} chunks at most.'.format(
+            len(section_order)))
+        chunk_count = len(section_order)
+    runs = partition_weights(
+        [len(section_gnames[section]) for section in section_order],
+        chunk_count)
+
+    # the glyphs each ligature or variation glyph is made from
+    glyph_inputs = {}
+    for components, lig_gname in get_ligatures(font).items():
+        glyph_inputs.setdefault(lig_gname, set()).update(components)
+    for base_gname, var_gname in get_variation_glyphs(font):
+        glyph_inputs.setdefault(var_gname, set()).add(base_gname)
+
+    chunk_gnames = []
+    for start, end in runs:
+        gnames = set()
+        for section in section_order[start:end]:
+            gnames.update(section_gnames[section])
+        chunk_gnames.append(gnames)
+    gather_connector_ligatures(chunk_gnames, connectors, glyph_inputs)
+
+    chunks = []
+    for gnames in chunk_gnames:
+        # the gathered ligatures may come from the sections of other chunks
+        own_sections = {get_section_name(*glyph_sections[gname], by_group)
+                        for gname in gnames}
+        for gname in list(gnames):
+            gnames.update(glyph_inputs.get(gname, ()))
+        chunks.append({
+            'sections': [section for section in section_order
+                         if section in own_sections],
+            'gnames': gnames,
+            'unicodes': {cdpt for cdpt, gname in cmap.items()
+                         if gname in gnames},
+        })
+    return chunks, connectors
+
+
+def get_subset_options():
+    """
+    Returns the options for subsetting the fonts into chunks, which keep all
+    the layout features and names. The SVG table is left out, because
+    fontTools needs the lxml package for subsetting it; subset_svg_table()
+    makes it instead.
+    """
+    options = subset.Options()
+    options.layout_features = ['*']
+    options.name_IDs = ['*']
+    options.name_languages = ['*']
+    options.name_legacy = True
+    options.notdef_outline = True
+    options.glyph_names = True
+    options.drop_tables = options.drop_tables + ['SVG']
+    return options
+
+
+def subset_font(font_data, gnames, unicodes):
+    """
+    Returns a TTFont with the glyphs 'gnames' and the code points 'unicodes'
+    of a font, and the glyphs that its ligature substitutions make from them.
+    """
+    font = TTFont(io.BytesIO(font_data))
+    subsetter = subset.Subsetter(get_subset_options())
+    subsetter.populate(glyphs=gnames, unicodes=unicodes)
+    subsetter.subset(font)
+    return font
+
+
+def read_svg_docs(font):
+    """
+    Returns a dictionary of glyph names to the SVG documents of a font's
+    glyphs, and whether the documents are compressed.
+    """
+    glyph_order = font.getGlyphOrder()
+    docs_dict = {}
+    compressed = False
+    for doc in font['SVG '].docList:
+        data, start_gid, end_gid = doc
+        compressed = compressed or getattr(doc, 'compressed', False)
+        for gid in range(start_gid, end_gid + 1):
+            docs_dict[glyph_order[gid]] = unshare_svg_doc(data, gid)
+    return docs_dict, compressed
+
+
+def subset_svg_table(font, svg_docs, compress_table=False, jobs=1):
+    """
+    Adds an SVG table to a subset of the color font, made from the documents
+    returned by read_svg_docs(). The documents are renumbered to the GIDs of
+    the subset, and shared and compressed as make_svg_font.py does.
+    """
+    svg_docs_dict = {}
+    for gid, gname in enumerate(font.getGlyphOrder()):
+        if gname in svg_docs:
+            svg_docs_dict[gid] = (
+                set_doc_glyph_id(svg_docs[gname], gid), gid, gid)
+    svg_docs_list, _ = share_svg_docs(svg_docs_dict)
+    if compress_table:
+        svg_docs_list = compress_svg_docs(svg_docs_list, jobs=jobs)
+
+    svg_table = newTable('SVG ')
+    svg_table.compressed = False
+    svg_table.docList = svg_docs_list
+    svg_table.colorPalettes = None
+    font['SVG '] = svg_table
+
+
+def format_unicode_range(cdpts):
+    """
+    Takes a set of code points, and returns the value of a unicode-range
+    descriptor, e.g. 'U+23, U+1F600-1F64F'.
+    """
+    ranges = []
+    for cdpt in sorted(cdpts):
+        if ranges and ranges[-1][1] == cdpt - 1:
+            ranges[-1][1] = cdpt
+        else:
+            ranges.append([cdpt, cdpt])
+    return ', '.join('U+{:X}'.format(start) if start == end
+                     else 'U+{:X}-{:X}'.format(start, end)
+                     for start, end in ranges)
+
+
+def format_font_face(family_name, font_path, unicodes, web_formats):
+    sources = []
+    for ext, css_format in CSS_FORMATS:
+        if ext == 'otf':
+            file_name = os.path.basename(font_path)
+        elif ext in web_formats:
+            file_name = os.path.basename(get_web_font_path(font_path, ext))
+        else:
+            continue
+        sources.append("url('{}') format('{}')".format(file_name, css_format))
+    return ('@font-face {{\n'
+            "  font-family: '{}';\n"
+            '  src: {};\n'
+            '  unicode-range: {};\n'
+            '}}\n'.format(family_name, ',\n       '.join(sources),
+                          format_unicode_range(unicodes)))
+
+
+def get_chunk_font_path(out_dir, font_name, num):
+    return os.path.join(out_dir, '{}-{}.otf'.format(font_name, num))
+
+
+def get_download_sizes(emoji_list, chunk_ranges, chunk_sizes):
+    """
+    Returns a list of tuples of the code points of each fully-qualified
+    emoji of 'emoji_list', and of the number of bytes that browsers download
+    for a page showing only that emoji: the sum of the sizes of the chunks
+    whose unicode-range includes any of its code points.
+    """
+    download_sizes = []
+    for _, _, cdpts, status in emoji_list:
+        if status != FULLY_QUALIFIED_STATUS:
+            continue
+        download_sizes.append((cdpts, sum(
+            size for unicodes, size in zip(chunk_ranges, chunk_sizes)
+            if not unicodes.isdisjoint(cdpts))))
+    return download_sizes
+
+
+def get_range_overlaps(chunk_ranges):
+    """
+    Finds the code points that are in the unicode-range of several chunks,
+    i.e. those of the glyphs that the ligatures of a chunk are made of, when
+    the glyphs belong to another chunk.
+    Returns a dictionary of tuples of chunk numbers (starting at 1) to the
+    sets of code points listed by all of those chunks.
+    """
+    cdpt_chunks = {}  # key: code point; value: list of chunk numbers
+    for num, unicodes in enumerate(chunk_ranges, 1):
+        for cdpt in unicodes:
+            cdpt_chunks.setdefault(cdpt, []).append(num)
+    overlaps = {}
+    for cdpt, nums in cdpt_chunks.items():
+        if len(nums) > 1:
+            overlaps.setdefault(tuple(nums), set()).add(cdpt)
+    return overlaps
+
+
+def log_download_sizes(emoji_list, chunk_ranges, chunk_sizes, font_size):
+    download_sizes = get_download_sizes(emoji_list, chunk_ranges,
+                                        chunk_sizes)
+    if not download_sizes:
+        return
+    overlaps = get_range_overlaps(chunk_ranges)
+    if overlaps:
+        multi_chunk_count = sum(
+            1 for cdpts, _ in download_sizes
+            if sum(1 for unicodes in chunk_ranges
+                   if not unicodes.isdisjoint(cdpts)) > 1)
+        log.info('{} code points are in the unicode-range of several chunks, '
+                 'so {} of the {} emoji download more than one chunk:\n'
+                 '{}'.format(
+                     sum(len(cdpts) for cdpts in overlaps.values()),
+                     multi_chunk_count, len(download_sizes),
+                     '\n'.join('  chunks {}: {}'.format(
+                         ', '.join(str(num) for num in nums),
+                         format_unicode_range(cdpts))
+                         for nums, cdpts in sorted(overlaps.items()))))
+    sizes = [size for _, size in download_sizes]
+    zwj_sizes = [size for cdpts, size in download_sizes if ZWJ_CDPT in cdpts]
+    log.info('A page with a single emoji downloads {:.0f} KB of BW chunks '
+             'on average, and {:.0f} KB at most, out of {:.0f} KB.'.format(
+                 sum(sizes) / len(sizes) / 1000, max(sizes) / 1000,
+                 font_size / 1000))
+    if zwj_sizes:
+        log.info('A page with a single zero-width joiner sequence downloads '
+                 '{:.0f} KB of BW chunks on average.'.format(
+                     sum(zwj_sizes) / len(zwj_sizes) / 1000))
+
+
+def split_fonts(bw_font_data, color_font_data, out_dir, chunk_count,
+                emoji_test_path=EMOJI_TEST_PATH, web_formats=(), jobs=1):
+    """
+    Splits the BW font, and the color font (unless 'color_font_data' is
+    None), into chunks of emoji groups (see make_chunks), and saves them in
+    'out_dir' along with a CSS file. The chunks are also saved in the web
+    font formats listed in 'web_formats'. 'jobs' is the number of processes
+    used for compressing the SVG documents of the color chunks and for
+    making the web fonts.
+    Returns the path of the CSS file.
+    """
+    emoji_list = parse_emoji_test_file(emoji_test_path)
+    with TTFont(io.BytesIO(bw_font_data)) as bw_font:
+        chunks, connectors = make_chunks(bw_font, emoji_list, chunk_count)
+        cmap = bw_font.getBestCmap()
+    connector_unicodes = {cdpt for cdpt, gname in cmap.items()
+                          if gname in connectors}
+
+    fonts = [(BW_FAMILY_NAME, bw_font_data, None)]
+    if color_font_data is not None:
+        with TTFont(io.BytesIO(color_font_data)) as color_font:
+            svg_docs = read_svg_docs(color_font)
+        fonts.append((COLOR_FAMILY_NAME, color_font_data, svg_docs))
+
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    font_paths = []
+    css_rules = []
+    bw_chunk_sizes = []
+    for num, chunk in enumerate(chunks, 1):
+        gnames = chunk['gnames'] | connectors
+        unicodes = chunk['unicodes'] | connector_unicodes
+        css_rules.append('/* {}: {} */\n'.format(
+            num, ', '.join(chunk['sections'])))
+        for family_name, font_data, svg_docs in fonts:
+            font = subset_font(font_data, gnames, unicodes)
+            extra_gnames = set(font.getGlyphOrder()).difference(
+                gnames, ['.notdef'])
+            if extra_gnames:
+                log.debug('Chunk {} also has ligatures of other chunks: '
+                          '{}'.format(num, ', '.join(sorted(extra_gnames))))
+            if svg_docs is not None:
+                subset_svg_table(font, *svg_docs, jobs=jobs)
+            font_name = font['name'].getDebugName(6)
+            font_path = get_chunk_font_path(out_dir, font_name, num)
+            chunk_data = get_font_data(font)
+            with io.open(font_path, 'wb') as fp:
+                fp.write(chunk_data)
+            if family_name == BW_FAMILY_NAME:
+                bw_chunk_sizes.append(len(chunk_data))
+            log.info("Wrote '{}' containing {} glyphs.".format(
+                font_path, len(font.getGlyphOrder())))
+            font.close()
+            font_paths.append(font_path)
+            css_rules.append(format_font_face(
+                family_name, font_path, chunk['unicodes'], web_formats))
+    log_download_sizes(emoji_list, [chunk['unicodes'] for chunk in chunks],
+                       bw_chunk_sizes, len(bw_font_data))
+
+    if web_formats:
+        rows = make_web_fonts(
+            [(font_path, None) for font_path in font_paths], web_formats,
+            jobs=jobs)
+        print(format_web_fonts_table(rows))
+
+    css_path = os.path.join(out_dir, CSS_FILENAME)
+    with io.open(css_path, 'w', encoding='utf-8') as fp:
+        fp.write('\n'.join(css_rules))
+    log.info("Wrote '{}' with {} chunks.".format(css_path, len(chunks)))
+    return css_path
+
+
+def validate_chunk_count(count_str):
+    try:
+        count = int(count_str)
+    except ValueError:
+        count = 0
+    if count < 1:
+        raise argparse.ArgumentTypeError(
+            "The number of chunks must be a positive integer.")
+    return count
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '-v',
+        '--verbose',
+        help='verbose mode. Use -vv for debug mode',
+        action='count',
+        default=0
+    )
+    parser.add_argument(
+        'bw_font',
+        help='path to the BW font',
+        type=validate_file_path,
+    )
+    parser.add_argument(
+        'color_font',
+        help='path to the color font',
+        nargs='?',
+        type=validate_file_path,
+    )
+    parser.add_argument(
+        '-n',
+        '--chunks',
+        help='number of chunks to split the fonts into. Defaults to '
+             '%(default)s',
+        type=validate_chunk_count,
+        default=4,
+    )
+    parser.add_argument(
+        '-o',
+        '--out-dir',
+        help=("directory to save the chunks and the CSS file in. Defaults "
+              "to a '{}' directory next to the BW font".format(
+                  CHUNKS_DIRNAME)),
+        metavar='DIR',
+        type=normalize_path,
+    )
+    parser.add_argument(
+        '--emoji-test',
+        help='path to the emoji-test.txt file. Defaults to %(default)s',
+        metavar='FILE',
+        type=validate_file_path,
+        default=EMOJI_TEST_PATH,
+    )
+    parser.add_argument(
+        '--web-formats',
+        help=('comma-separated list of web font formats (woff2, woff) to '
+              'also save the chunks in. WOFF2 requires the brotli package'),
+        metavar='FORMATS',
+        type=validate_web_formats,
+        default=[],
+    )
+    parser.add_argument(
+        '-j',
+        '--jobs',
+        help=('number of worker processes used for compressing the SVG '
+              'documents of the color chunks and for making the web fonts. '
+              'Defaults to %(default)s'),
+        type=validate_job_count,
+        default=1,
+    )
+    opts = parser.parse_args(args)
+
+    if not opts.verbose:
+        level = "WARNING"
+    elif opts.verbose == 1:
+        level = "INFO"
+    else:
+        level = "DEBUG"
+    logging.basicConfig(level=level)
+
+    if not check_web_formats(opts.web_formats):
+        return 1
+
+    out_dir = opts.out_dir or os.path.join(
+        os.path.dirname(opts.bw_font), CHUNKS_DIRNAME)
+    with io.open(opts.bw_font, 'rb') as fp:
+        bw_font_data = fp.read()
+    color_font_data = None
+    if opts.color_font:
+        with io.open(opts.color_font, 'rb') as fp:
+            color_font_data = fp.read()
+    split_fonts(bw_font_data, color_font_data, out_dir, opts.chunks,
+                opts.emoji_test, opts.web_formats, opts.jobs)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
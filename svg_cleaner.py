@@ -25,8 +25,12 @@ The files we're getting that are exported from AI contain lots of extra
 data so that it can reimport the svg, and we don't need it."""
 
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+import filecmp
 import glob
+import hashlib
 import io
+import json
 import logging
 import os
 import re
@@ -36,10 +40,21 @@ import sys
 from xml.parsers import expat
 from xml.sax import saxutils
 
-from make_bw_font import validate_dir_path, normalize_path
+from fontTools.pens.recordingPen import RecordingPen
+from fontTools.svgLib.path.parser import parse_path
+
+from alias_index import AliasIndex
+from file_loader import decode_text, read_files
+from make_bw_font import (
+    validate_dir_path, validate_file_path, validate_job_count,
+    normalize_path)
 
 log = logging.getLogger('svg_cleaner')
 
+# Name of the file that records the hashes of the input and output files of
+# the last run. It's saved in the output directory.
+MANIFEST_FILENAME = '.svg_cleaner_manifest.json'
+
 # Expat doesn't allow me to identify empty tags (in particular, with an
 # empty tag the parse location for the start and end is not the same) so I
 # have to take a dom-like approach if I want to identify them. There are a
@@ -51,6 +66,8 @@ log = logging.getLogger('svg_cleaner')
 
 
 class _Elem_Node(object):
+    __slots__ = ('name', 'attrs', 'contents')
+
     def __init__(self, name, attrs, contents):
         self.name = name
         self.attrs = attrs
@@ -68,6 +85,8 @@ class _Elem_Node(object):
 
 
 class _Text_Node(object):
+    __slots__ = ('text',)
+
     def __init__(self, text):
         self.text = text
 
@@ -75,6 +94,321 @@ class _Text_Node(object):
         return "text('%s')" % self.text
 
 
+# Number of parameters of each path command
+PATH_PARAM_COUNTS = {
+    'M': 2, 'L': 2, 'H': 1, 'V': 1, 'C': 6, 'S': 4, 'Q': 4, 'T': 2, 'A': 7,
+    'Z': 0}
+# Kind of each parameter of an arc: radii and rotation ('n'), flags ('f')
+# and end point coordinates ('x', 'y')
+ARC_PARAM_KINDS = 'nnnffxy'
+PATH_COMMANDS = ('shortest', 'absolute', 'relative')
+# Precision of the gradient stop offsets and opacities. 1/1000 of the
+# gradient vector is below what 8-bit color channels can show.
+STOP_PRECISION = 3
+# Highest precision tried for keeping a path within the tolerance
+MAX_PATH_PRECISION = 6
+
+RE_PATH_COMMAND = re.compile(r'[\s,]*([MmZzLlHhVvCcSsQqTtAa])')
+RE_PATH_NUMBER = re.compile(
+    r'[\s,]*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)')
+RE_PATH_FLAG = re.compile(r'[\s,]*([01])')
+RE_PATH_END = re.compile(r'[\s,]*$')
+RE_TRAILING_DIGITS = re.compile(r'[\d.]*$')
+RE_HEX_COLOR = re.compile(
+    r'#([0-9a-fA-F])\1([0-9a-fA-F])\2([0-9a-fA-F])\3$')
+
+
+def get_param_kinds(cmd):
+    """Return the kinds of the parameters of an (upper case) path command."""
+    if cmd == 'A':
+        return ARC_PARAM_KINDS
+    if cmd == 'H':
+        return 'x'
+    if cmd == 'V':
+        return 'y'
+    return 'xy' * (PATH_PARAM_COUNTS[cmd] // 2)
+
+
+def parse_path_data(path_data):
+    """
+    Parse the data of a path's 'd' attribute.
+    Return a list of (command, parameters) tuples, whose commands are upper
+    case and whose coordinates are absolute. The coordinate pairs that
+    follow a 'moveto' are returned as 'lineto' commands. Raise ValueError if
+    the data isn't valid.
+    """
+    segments = []
+    pos = 0
+    cur_x = cur_y = start_x = start_y = 0
+    match = RE_PATH_COMMAND.match(path_data, pos)
+    cmd = None
+    while True:
+        if match:
+            cmd = match.group(1)
+            pos = match.end()
+        elif cmd is None or cmd in 'Zz':
+            raise ValueError('invalid path data: %r' % path_data[pos:])
+        elif cmd == 'M':
+            cmd = 'L'
+        elif cmd == 'm':
+            cmd = 'l'
+        upper_cmd = cmd.upper()
+        is_rel = cmd != upper_cmd
+
+        params = []
+        for kind in get_param_kinds(upper_cmd):
+            num = (RE_PATH_FLAG if kind == 'f' else RE_PATH_NUMBER).match(
+                path_data, pos)
+            if not num:
+                raise ValueError('invalid path data: %r' % path_data[pos:])
+            pos = num.end()
+            value = float(num.group(1))
+            if is_rel and kind == 'x':
+                value += cur_x
+            elif is_rel and kind == 'y':
+                value += cur_y
+            params.append(value)
+        segments.append((upper_cmd, params))
+
+        if upper_cmd == 'Z':
+            cur_x, cur_y = start_x, start_y
+        elif upper_cmd == 'H':
+            cur_x = params[0]
+        elif upper_cmd == 'V':
+            cur_y = params[0]
+        else:
+            cur_x, cur_y = params[-2:]
+            if upper_cmd == 'M':
+                start_x, start_y = cur_x, cur_y
+
+        if RE_PATH_END.match(path_data, pos):
+            return segments
+        match = RE_PATH_COMMAND.match(path_data, pos)
+
+
+def format_fixed(value, precision):
+    """
+    Format an integer that counts units of 10**-precision as the shortest
+    decimal number (e.g. 50 with precision 2 is '.5').
+    """
+    digits = str(abs(value)).rjust(precision + 1, '0')
+    int_part = digits[:len(digits) - precision].lstrip('0')
+    frac_part = digits[len(digits) - precision:].rstrip('0')
+    text = int_part + ('.' + frac_part if frac_part else '')
+    if not text:
+        return '0'
+    return '-' + text if value < 0 else text
+
+
+def join_numbers(numbers, prev=''):
+    """
+    Join formatted numbers, adding a separator only where the numbers would
+    otherwise run into each other. 'prev' is the text that comes before
+    them.
+    """
+    parts = []
+    # the digits of the last number; empty after a command letter
+    last = RE_TRAILING_DIGITS.search(prev).group()
+    for num in numbers:
+        if last and (num[0].isdigit() or (num[0] == '.' and '.' not in last)):
+            parts.append(' ')
+        parts.append(num)
+        last = num
+    return ''.join(parts)
+
+
+def get_path_deviation(path_data, other_path_data):
+    """
+    Draw the data of two paths, and return the largest difference between
+    the coordinates of their points, or None if they aren't drawn with the
+    same segments. Arcs are drawn as cubic curves. The distance between two
+    curves is never larger than the largest distance between their control
+    points, so this bounds the change of the rendered outline.
+    """
+    outlines = []
+    for data in (path_data, other_path_data):
+        pen = RecordingPen()
+        try:
+            parse_path(data, pen)
+        except (ValueError, IndexError) as err:
+            log.debug('path data not drawn: %s' % err)
+            return None
+        # the pen gets an extra line back to the start of a closed contour
+        # unless its last point is exactly the start point, which relative
+        # coordinates can miss by a rounding error of the float arithmetic;
+        # so lines that don't go anywhere are left out
+        outline = []
+        cur_pt = start_pt = None
+        for op, pts in pen.value:
+            if op == 'lineTo' and cur_pt and max(abs(pts[0][0] - cur_pt[0]),
+                                      abs(pts[0][1] - cur_pt[1])) < 1e-9:
+                continue
+            if op == 'moveTo':
+                start_pt = pts[0]
+            cur_pt = pts[-1] if pts else start_pt
+            outline.append((op, pts))
+        outlines.append(outline)
+    outline, other_outline = outlines
+    if len(outline) != len(other_outline):
+        return None
+    deviation = 0
+    for (op, pts), (other_op, other_pts) in zip(outline, other_outline):
+        if op != other_op or len(pts) != len(other_pts):
+            return None
+        for (x, y), (other_x, other_y) in zip(pts, other_pts):
+            deviation = max(deviation, abs(x - other_x), abs(y - other_y))
+    return deviation
+
+
+class SvgMinifier(object):
+    """
+    Shortens the data of paths and gradient stops.
+
+    The coordinates of the paths are rounded to 'precision' decimals in
+    absolute terms, so that the rounding errors don't add up along the path.
+    Each command is then written with absolute or relative coordinates,
+    whichever is shorter ('commands' is 'shortest'), or as chosen. Repeated
+    command letters are left out, and so are the separators that aren't
+    needed.
+
+    Each minified path is drawn and compared with the original one (see
+    get_path_deviation); if any point is off by more than 'tolerance' (in
+    the path's user units) more decimals are kept, and the original data is
+    kept if that doesn't help either. The tolerance defaults to half a unit
+    of the last decimal kept.
+
+    Gradient stop offsets and opacities are rounded to STOP_PRECISION
+    decimals, and stop colors are written in their short form (#RGB) where
+    possible.
+    """
+
+    def __init__(self, precision=2, commands='shortest', tolerance=None):
+        self.precision = precision
+        self.commands = commands
+        if tolerance is None:
+            tolerance = .5 * 10 ** -precision
+        self.tolerance = tolerance
+        self.stats = self.new_stats()
+
+    def get_settings(self):
+        return {'precision': self.precision, 'commands': self.commands,
+                'tolerance': self.tolerance}
+
+    @staticmethod
+    def new_stats():
+        return {'paths': 0, 'path_bytes': 0, 'minified_path_bytes': 0,
+                'unchanged_paths': 0, 'stop_bytes': 0,
+                'minified_stop_bytes': 0}
+
+    def reset_stats(self):
+        """Return the byte counts since the last reset, and reset them."""
+        stats = self.stats
+        self.stats = self.new_stats()
+        return stats
+
+    def _write_path(self, segments, precision):
+        scale = 10 ** precision
+        out = []
+        prev_letter = ''
+        cur = {'x': 0, 'y': 0}
+        start_x = start_y = 0
+        for cmd, params in segments:
+            if cmd == 'Z':
+                out.append('z')
+                prev_letter = 'z'
+                cur['x'], cur['y'] = start_x, start_y
+                continue
+
+            kinds = get_param_kinds(cmd)
+            values = [int(value) if kind == 'f' else round(value * scale)
+                      for kind, value in zip(kinds, params)]
+            candidates = []
+            for letter in (cmd, cmd.lower()):
+                if self.commands == 'absolute' and letter != cmd:
+                    continue
+                if self.commands == 'relative' and letter == cmd:
+                    continue
+                is_rel = letter != cmd
+                numbers = [
+                    str(value) if kind == 'f' else format_fixed(
+                        value - cur[kind] if is_rel and kind in 'xy'
+                        else value, precision)
+                    for kind, value in zip(kinds, values)]
+                implicit = (letter == prev_letter and letter not in 'Mm') or (
+                    prev_letter + letter in ('ML', 'ml'))
+                if implicit:
+                    text = join_numbers(numbers, out[-1] if out else '')
+                else:
+                    text = letter + join_numbers(numbers, letter)
+                # on a tie, keep the case of the previous command, so that
+                # the next letter is more likely to be left out
+                candidates.append(
+                    (len(text), letter.isupper() != prev_letter.isupper(),
+                     text, letter))
+            _, _, text, letter = min(candidates)
+            out.append(text)
+            prev_letter = letter
+
+            for kind, value in zip(kinds, values):
+                if kind in 'xy':
+                    cur[kind] = value
+            if cmd == 'M':
+                start_x, start_y = cur['x'], cur['y']
+        return ''.join(out)
+
+    def minify_path_data(self, path_data):
+        """
+        Return the minified path data, or the original one if it can't be
+        minified within the tolerance.
+        """
+        self.stats['paths'] += 1
+        self.stats['path_bytes'] += len(path_data)
+        try:
+            segments = parse_path_data(path_data)
+        except ValueError as err:
+            log.debug('path data not minified: %s' % err)
+            segments = None
+        result = path_data
+        for precision in range(self.precision, MAX_PATH_PRECISION + 1):
+            if segments is None:
+                break
+            minified = self._write_path(segments, precision)
+            deviation = get_path_deviation(path_data, minified)
+            # allow for the error of the float arithmetic
+            if deviation is not None and (
+                    deviation <= self.tolerance + 1e-9):
+                if len(minified) < len(path_data):
+                    result = minified
+                break
+        if result == path_data:
+            self.stats['unchanged_paths'] += 1
+        self.stats['minified_path_bytes'] += len(result)
+        return result
+
+    def minify_stop_value(self, name, value):
+        """Return the minified value of a gradient stop's attribute."""
+        result = value
+        if name == 'stop-color':
+            match = RE_HEX_COLOR.match(value)
+            if match:
+                result = '#' + ''.join(match.groups())
+        elif name in ('offset', 'stop-opacity'):
+            is_percent = value.endswith('%')
+            try:
+                number = float(value[:-1] if is_percent else value)
+            except ValueError:
+                number = None
+            if number is not None:
+                result = format_fixed(
+                    round(number * 10 ** STOP_PRECISION), STOP_PRECISION) + (
+                    '%' if is_percent else '')
+                if len(result) > len(value):
+                    result = value
+        self.stats['stop_bytes'] += len(value)
+        self.stats['minified_stop_bytes'] += len(result)
+        return result
+
+
 class SvgCleaner(object):
     """
     Strip out unwanted parts of an svg file, primarily the xml declaration
@@ -100,10 +434,13 @@ class SvgCleaner(object):
     dimensions used for the character box.
     """
 
-    def __init__(self, strip=False, color=True):
+    def __init__(self, strip=False, color=True, stream=False, minifier=None):
         self.reader = SvgCleaner._Reader()
-        self.cleaner = SvgCleaner._Cleaner(color)
+        self.cleaner = SvgCleaner._Cleaner(color, minifier)
+        self.minifier = minifier
         self.writer = SvgCleaner._Writer(strip)
+        self.streamer = SvgCleaner._Streamer(self.cleaner, self.writer)
+        self._stream = stream
 
     class _Reader(object):
         """
@@ -127,7 +464,7 @@ class SvgCleaner(object):
         def _end_element(self, name):
             self._flush_textbuf()
             if len(self._stack) > 1:
-                self._stack = self._stack[:-1]
+                self._stack.pop()
 
         def _character_data(self, data):
             if len(self._stack):
@@ -147,22 +484,27 @@ class SvgCleaner(object):
             parser.EndElementHandler = self._end_element
             parser.CharacterDataHandler = self._character_data
             self._reset(parser)
-            parser.Parse(data)
+            # the data is final, so that expat reports empty and truncated
+            # documents as errors
+            parser.Parse(data, True)
             return self._stack[0]
 
     class _Cleaner(object):
-        def __init__(self, color):
+        def __init__(self, color, minifier=None):
             log.warning('cleaner color: %s' % color)
             self._color = color
+            # optional SvgMinifier for the path data and gradient stops
+            self._minifier = minifier
 
-        def _clean_elem(self, node):
+        def _clean_attrs(self, name, attrs):
+            """Return the cleaned attributes of an element."""
             viewBox, x, y, width, height = None, None, None, None, None
             nattrs = {}
-            for k, v in node.attrs.items():
+            for k, v in attrs.items():
                 if not self._color:
                     if k in ['class', 'style'] or k.startswith('xmlns:xlink'):
                         continue
-                if node.name == 'svg' and k in [
+                if name == 'svg' and k in [
                         'x', 'y', 'id', 'version', 'viewBox', 'width',
                         'height', 'enable-background', 'xml:space',
                         'xmlns:graph', 'xmlns:i', 'xmlns:x']:
@@ -179,9 +521,15 @@ class SvgCleaner(object):
                     log.debug('removing %s=%s' % (k, v))
                     continue
                 v = re.sub(r'\s+', ' ', v)
+                if self._minifier:
+                    if name == 'path' and k == 'd':
+                        v = self._minifier.minify_path_data(v)
+                    elif name == 'stop' and k in [
+                            'offset', 'stop-color', 'stop-opacity']:
+                        v = self._minifier.minify_stop_value(k, v)
                 nattrs[k] = v
 
-            if node.name == 'svg':
+            if name == 'svg':
                 if viewBox:
                     x, y, width, height = viewBox.split()
                     nattrs['viewBox'] = viewBox
@@ -191,12 +539,28 @@ class SvgCleaner(object):
                 if not width or not height:
                     if not viewBox:
                         raise ValueError('no viewBox, width, or height')
-            node.attrs = nattrs
+            return nattrs
+
+        def _is_hidden(self, attrs):
+            style = attrs.get('style')
+            return bool((style and 'display:none' in style) or (
+                attrs.get('display') == 'none'))
+
+        def _is_dropped(self, name):
+            """
+            Return True if an element with this name is always removed from
+            its parent's contents.
+            """
+            if name == 'i:pgf' or name == 'foreignObject':
+                return True
+            return not self._color and name in [
+                'style', 'linearGradient', 'radialGradient']
+
+        def _clean_elem(self, node):
+            node.attrs = self._clean_attrs(node.name, node.attrs)
 
             # if display:none, skip this and its children
-            style = node.attrs.get('style')
-            if (style and 'display:none' in style) or (
-                    node.attrs.get('display') == 'none'):
+            if self._is_hidden(node.attrs):
                 node.contents = []
                 return
 
@@ -236,14 +600,17 @@ class SvgCleaner(object):
             if wpos < len(node.contents):
                 node.contents = node.contents[:wpos]
 
-        def _clean_text(self, node):
-            text = node.text.strip()
+        def _clean_text_data(self, text):
+            text = text.strip()
             # common case is text is empty (line endings between elements)
             if text:
                 # main goal here is to leave linefeeds in for style elements
                 text = re.sub(r'[ \t]*\n+[ \t]*', '\n', text)
                 text = re.sub(r'[ \t]+', ' ', text)
-            node.text = text
+            return text
+
+        def _clean_text(self, node):
+            node.text = self._clean_text_data(node.text)
 
         def clean(self, node):
             if isinstance(node, _Text_Node):
@@ -264,6 +631,36 @@ class SvgCleaner(object):
             log.warning('writer strip: %s' % strip)
             self._strip = strip
 
+        def _start_tag(self, name, attrs):
+            """
+            Return the start tag of an element, without the closing '>' or
+            '/>'.
+            """
+            line = ['<%s' % name]
+            # custom sort attributes of svg, yes this is a hack
+            if name == 'svg':
+                def svgsort(k):
+                    if k == 'width':
+                        return (0, None)
+                    elif k == 'height':
+                        return (1, None)
+                    else:
+                        return (2, k)
+                ks = sorted(attrs.keys(), key=svgsort)
+            else:
+                def defsort(k):
+                    if k == 'id':
+                        return (0, None)
+                    elif k == 'class':
+                        return (1, None)
+                    else:
+                        return (2, k)
+                ks = sorted(attrs.keys(), key=defsort)
+            for k in ks:
+                v = attrs[k]
+                line.append(' %s=%s' % (k, saxutils.quoteattr(v)))
+            return ''.join(line)
+
         def _write_node(self, node, lines, indent):
             """
             Node is a node generated by _Reader, either a TextNode or an
@@ -276,29 +673,7 @@ class SvgCleaner(object):
             else:
                 margin = '' if self._strip else '  ' * indent
                 line = [margin]
-                line.append('<%s' % node.name)
-                # custom sort attributes of svg, yes this is a hack
-                if node.name == 'svg':
-                    def svgsort(k):
-                        if k == 'width':
-                            return (0, None)
-                        elif k == 'height':
-                            return (1, None)
-                        else:
-                            return (2, k)
-                    ks = sorted(node.attrs.keys(), key=svgsort)
-                else:
-                    def defsort(k):
-                        if k == 'id':
-                            return (0, None)
-                        elif k == 'class':
-                            return (1, None)
-                        else:
-                            return (2, k)
-                    ks = sorted(node.attrs.keys(), key=defsort)
-                for k in ks:
-                    v = node.attrs[k]
-                    line.append(' %s=%s' % (k, saxutils.quoteattr(v)))
+                line.append(self._start_tag(node.name, node.attrs))
                 if node.contents:
                     line.append('>')
                     lines.append(''.join(line))
@@ -318,6 +693,180 @@ class SvgCleaner(object):
             self._write_node(root, lines, 0)
             return ''.join(lines) if self._strip else '\n'.join(lines)
 
+    class _Streamer(object):
+        """
+        Cleans and writes svg data as expat events arrive, without building a
+        tree of nodes. The output is the same as the one of _Reader, _Cleaner
+        and _Writer combined.
+
+        Each element is resolved once it's known whether it's dropped,
+        replaced by its only child, or kept: a 'g' or 'switch' element when
+        it gets a second child (or a 'g' with attributes gets its first one),
+        any other element when it gets its first child, and all of them when
+        their end tag is reached. The output lines that may still change are
+        kept in a list of (depth, text) tuples (depth is None for text
+        content); an element reserves a slot for its start tag, which is
+        filled in once the element is resolved. Replacing an element by its
+        child only shifts the depth of the lines of that child. The lines
+        that come before the slot of the first unresolved element are final,
+        and are written out as soon as possible. The contents of elements that
+        are dropped or hidden are skipped without being processed.
+        """
+
+        def __init__(self, cleaner, writer):
+            self._cleaner = cleaner
+            self._writer = writer
+
+        def _reset(self):
+            # each frame is a list of
+            # [name, attrs, line index, depth, children count,
+            #  last child is text, hidden, start tag written]
+            self._frames = []
+            self._lines = []
+            self._offset = 0  # the line index of the first item of _lines
+            self._out = io.StringIO()
+            self._textbuf = []
+            self._skip = 0
+
+        def _add_child(self, is_text):
+            frame = self._frames[-1]
+            frame[4] += 1
+            frame[5] = is_text
+            if not frame[7] and self._is_kept(frame):
+                self._write_start_tag(frame)
+
+        def _is_kept(self, frame):
+            """
+            Returns whether an element that has children can no longer be
+            dropped or replaced by its child.
+            """
+            name, attrs, _, depth, count = frame[:5]
+            if not depth:  # the root element is always kept
+                return True
+            if name == 'g':
+                return count > 1 or any(
+                    attr != 'i:extraneous' for attr in attrs)
+            if name == 'switch':
+                return count > 1
+            return True
+
+        def _write_start_tag(self, frame):
+            name, attrs, index, depth = frame[:4]
+            if depth and name == 'g' and 'i:extraneous' in attrs:
+                del attrs['i:extraneous']
+            self._lines[index - self._offset] = (
+                depth, self._writer._start_tag(name, attrs) + '>')
+            frame[7] = True
+            self._write_lines()
+
+        def _write_lines(self):
+            # the lines before the slot of the first unresolved element are
+            # final
+            end = len(self._lines)
+            for frame in self._frames:
+                if not frame[7]:
+                    end = frame[2] - self._offset
+                    break
+            if not end:
+                return
+            out = self._out
+            strip = self._writer._strip
+            for depth, text in self._lines[:end]:
+                if strip:
+                    out.write(text)
+                    continue
+                if out.tell():
+                    out.write('\n')
+                if depth is not None:
+                    out.write('  ' * depth)
+                out.write(text)
+            del self._lines[:end]
+            self._offset += end
+
+        def _start_element(self, name, attrs):
+            if self._skip or (self._frames and self._frames[-1][6]):
+                self._skip += 1
+                return
+            self._flush_textbuf()
+            if self._frames and self._cleaner._is_dropped(name):
+                self._skip = 1
+                return
+            nattrs = self._cleaner._clean_attrs(name, attrs)
+            hidden = self._cleaner._is_hidden(nattrs)
+            self._frames.append(
+                [name, nattrs, self._offset + len(self._lines),
+                 len(self._frames), 0, False, hidden, False])
+            self._lines.append(None)  # slot for the start tag
+
+        def _end_element(self, name):
+            if self._skip:
+                self._skip -= 1
+                return
+            self._flush_textbuf()
+            name, attrs, index, depth, count, text_child, _, written = (
+                self._frames.pop())
+            lines = self._lines
+            index -= self._offset
+
+            if written:
+                lines.append((depth, '</%s>' % name))
+            else:
+                if self._frames:  # the root element is always kept
+                    if name == 'g':
+                        if not count:
+                            del lines[index:]
+                            return
+                        if 'i:extraneous' in attrs:
+                            del attrs['i:extraneous']
+                        unwrap = not attrs and count == 1
+                    else:
+                        unwrap = name == 'switch' and count == 1
+                    if unwrap:
+                        del lines[index]
+                        for i in range(index, len(lines)):
+                            line_depth, text = lines[i]
+                            if line_depth is not None:
+                                lines[i] = (line_depth - 1, text)
+                        self._add_child(text_child)
+                        self._write_lines()
+                        return
+
+                start_tag = self._writer._start_tag(name, attrs)
+                if count:
+                    lines[index] = (depth, start_tag + '>')
+                    lines.append((depth, '</%s>' % name))
+                else:
+                    lines[index] = (depth, start_tag + '/>')
+            if self._frames:
+                self._add_child(False)
+            self._write_lines()
+
+        def _character_data(self, data):
+            if self._frames and not self._skip and not self._frames[-1][6]:
+                self._textbuf.append(data)
+
+        def _flush_textbuf(self):
+            if self._textbuf:
+                text = self._cleaner._clean_text_data(''.join(self._textbuf))
+                self._textbuf = []
+                if text:
+                    self._lines.append((None, text))
+                    self._add_child(True)
+
+        def clean_text(self, data):
+            """Return the cleaned svg data."""
+            parser = expat.ParserCreate()
+            parser.StartElementHandler = self._start_element
+            parser.EndElementHandler = self._end_element
+            parser.CharacterDataHandler = self._character_data
+            self._reset()
+            # as in tree mode, expat raises an error for a document without
+            # a root element, or one that ends before the root is closed
+            parser.Parse(data, True)
+            text = self._out.getvalue()
+            self._reset()
+            return text
+
     def tree_from_text(self, svg_text):
         return self.reader.from_text(svg_text)
 
@@ -329,45 +878,344 @@ class SvgCleaner(object):
 
     def clean_svg(self, svg_text):
         """Return the cleaned svg_text."""
+        if self._stream:
+            return self.streamer.clean_text(svg_text)
         tree = self.tree_from_text(svg_text)
         self.clean_tree(tree)
         return self.tree_to_text(tree)
 
 
-def clean_svg_files(file_paths, out_dir, strip=False, color=True):
-    count = 0
-    skipped = 0
+# The SvgCleaner used by the current process (see clean_svg_files)
+_cleaner = None
 
-    cleaner = SvgCleaner(strip, color)
 
-    for svg_file_path in file_paths:
-        if os.path.islink(svg_file_path):
-            log.debug('skipped alias: %s', svg_file_path)
-            skipped += 1
-            continue
-        log.debug('read: %s', svg_file_path)
-        with io.open(svg_file_path, encoding='utf-8') as in_fp:
-            result = cleaner.clean_svg(in_fp.read())
+def _init_cleaner(strip, color, stream, minifier=None):
+    global _cleaner
+    _cleaner = SvgCleaner(strip, color, stream, minifier)
 
-        if out_dir:
-            out_path = os.path.join(out_dir, os.path.basename(svg_file_path))
+
+def get_text_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def get_file_hash(file_path, data=None):
+    """
+    Return the hash of a file's text, or None if it can't be read.
+    The file isn't read if its contents are provided as 'data' (bytes).
+    """
+    try:
+        if data is None:
+            with io.open(file_path, encoding='utf-8') as fp:
+                return get_text_hash(fp.read())
+        return get_text_hash(decode_text(data))
+    except (OSError, ValueError):
+        return None
+
+
+def read_manifest(manifest_dir, settings):
+    """
+    Reads the manifest of a previous run, made with the same settings.
+    Returns a dictionary of file names to (input hash, output hash) lists.
+    The output hash of a file that failed to be cleaned is None.
+    """
+    manifest_path = os.path.join(manifest_dir, MANIFEST_FILENAME)
+    if not os.path.isfile(manifest_path):
+        return {}
+    try:
+        with io.open(manifest_path, encoding='utf-8') as fp:
+            manifest = json.load(fp)
+    except (OSError, ValueError) as err:
+        log.warning("Ignored unreadable manifest '{}'. {}".format(
+            manifest_path, err))
+        return {}
+    if manifest.get('settings') != settings:
+        log.info('The settings of the previous run differ. '
+                 'Cleaning all files.')
+        return {}
+    return manifest['files']
+
+
+def write_manifest(manifest_dir, settings, files):
+    manifest_path = os.path.join(manifest_dir, MANIFEST_FILENAME)
+    with io.open(manifest_path, 'w', encoding='utf-8') as fp:
+        json.dump({'settings': settings, 'files': files}, fp, indent=0,
+                  sort_keys=True)
+
+
+def _clean_svg_file(svg_file_path, out_path, data=None):
+    """
+    Cleans one SVG file and writes the result to 'out_path'. The file isn't
+    read if its contents are provided as 'data' (bytes).
+    Returns a tuple of an error message (None on success), the hash of the
+    output, and the byte counts of the minifier (or None).
+    """
+    minifier = _cleaner.minifier
+    if minifier:
+        minifier.reset_stats()
+    try:
+        if data is None:
+            log.debug('read: %s', svg_file_path)
+            with io.open(svg_file_path, encoding='utf-8') as in_fp:
+                data = in_fp.read()
         else:
-            out_path = svg_file_path
+            data = decode_text(data)
+        result = _cleaner.clean_svg(data)
 
         with io.open(out_path, 'w', encoding='utf-8') as out_fp:
             log.debug('write: %s', out_path)
             out_fp.write(result)
-            count += 1
+    except Exception as err:
+        # any error is reported with the file, instead of stopping the run
+        return '{}: {}'.format(type(err).__name__, err), None, None
+    stats = minifier.reset_stats() if minifier else None
+    return None, get_text_hash(result), stats
+
+
+def get_out_path(svg_file_path, out_dir):
+    if out_dir:
+        return os.path.join(out_dir, os.path.basename(svg_file_path))
+    return svg_file_path
+
+
+def copy_clean_file(out_path, copy_out_path):
+    """
+    Writes the cleaned data of a source file to the output of a copy of it.
+    Returns False if the output of the copy was the same already.
+    """
+    if os.path.isfile(copy_out_path) and filecmp.cmp(
+            out_path, copy_out_path, shallow=False):
+        return False
+    shutil.copyfile(out_path, copy_out_path)
+    log.debug('write: %s', copy_out_path)
+    return True
+
+
+def get_minify_report(minifier, minify_stats):
+    """
+    Takes a dictionary of file paths to the byte counts of the minifier.
+    Returns a dictionary of the minifier's settings, the totals of the byte
+    counts, and the byte counts of each file.
+    """
+    report = minifier.get_settings()
+    totals = SvgMinifier.new_stats()
+    for stats in minify_stats.values():
+        for key, value in stats.items():
+            totals[key] += value
+    report.update(totals)
+    report['files'] = minify_stats
+    return report
+
+
+def clean_svg_files(file_paths, out_dir, strip=False, color=True, jobs=1,
+                    stream=False, incremental=False, minifier=None,
+                    report_path=None, aliases_files=()):
+    """
+    Cleans the SVG files, optionally using 'jobs' worker processes.
+    Files that fail to be cleaned are reported but don't stop the others from
+    being processed. Returns a list of the paths of the failed files.
+
+    When a 'minifier' (SvgMinifier) is given, the path data and gradient
+    stops are minified too, and the byte counts of each file are saved in a
+    JSON report at 'report_path', if given.
+
+    In incremental mode, the files whose input and output did not change
+    since the last run are left untouched, and the outputs of input files
+    that no longer exist are deleted. The files that failed, and the copies
+    written from their source, are kept in the manifest too, so that their
+    outputs are deleted along with their input files.
+
+    Symbolic links and their stand-ins (see alias_index.py) are skipped. The
+    copies listed in the 'aliases_files' get the cleaned data of their
+    source file, if the source is cleaned too.
+    """
+    count = 0
+    skipped = 0
+    unchanged = 0
 
     if out_dir:
         out_folder = out_dir
     else:
-        out_folder = os.path.dirname(out_path)
+        out_folder = os.path.dirname(file_paths[-1])
+
+    settings = {'strip': strip, 'color': color}
+    if minifier:
+        settings['minify'] = minifier.get_settings()
+    prev_files = read_manifest(out_folder, settings) if incremental else {}
+    files = {}  # key: file name; value: [input hash, output hash]
+
+    # links to other files (symlinks, or their stand-ins) are left as they
+    # are; their source files get cleaned
+    alias_index = AliasIndex(file_paths, aliases_files)
+    in_file_paths = []
+    listed_aliases = []
+    for svg_file_path in file_paths:
+        if alias_index.is_link(svg_file_path):
+            log.debug('skipped alias: %s', svg_file_path)
+            skipped += 1
+        elif alias_index.is_alias(svg_file_path):
+            listed_aliases.append(svg_file_path)
+        else:
+            in_file_paths.append(svg_file_path)
+
+    # the copies of a source file get its cleaned data, unless the source
+    # isn't cleaned, in which case they're cleaned on their own
+    in_realpaths = {os.path.realpath(fpath): fpath for fpath in in_file_paths}
+    copies = {}  # key: source file path; value: list of copy paths
+    for alias_path in listed_aliases:
+        source_path = in_realpaths.get(alias_index.get_source(alias_path))
+        if source_path is None:
+            in_file_paths.append(alias_path)
+        else:
+            copies.setdefault(source_path, []).append(alias_path)
+
+    if incremental:
+        # the input files are read ahead of hashing them
+        in_files = read_files(in_file_paths)
+    else:
+        in_files = ((fpath, None, None) for fpath in in_file_paths)
+
+    tasks = []
+    in_hashes = []
+    for svg_file_path, _, data in in_files:
+        file_name = os.path.basename(svg_file_path)
+        out_path = get_out_path(svg_file_path, out_dir)
+
+        if incremental:
+            in_hash = get_file_hash(svg_file_path, data)
+            prev_hashes = prev_files.get(file_name)
+            # the files that failed in the previous run have no output hash
+            if prev_hashes and in_hash and prev_hashes[1]:
+                prev_in_hash, prev_out_hash = prev_hashes
+                if out_dir:
+                    is_unchanged = in_hash == prev_in_hash and (
+                        get_file_hash(out_path) == prev_out_hash)
+                else:
+                    # the input file is the output of the previous run
+                    is_unchanged = in_hash == prev_out_hash
+                if is_unchanged:
+                    log.debug('unchanged: %s', svg_file_path)
+                    files[file_name] = prev_hashes
+                    unchanged += 1
+                    continue
+            in_hashes.append(in_hash)
+
+        tasks.append((svg_file_path, out_path))
+
+    if jobs > 1 and len(tasks) > 1:
+        chunksize = max(1, len(tasks) // (jobs * 4))
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_cleaner,
+                                 initargs=(strip, color, stream,
+                                           minifier)) as executor:
+            results = list(executor.map(
+                _clean_svg_file, *zip(*tasks), chunksize=chunksize))
+    else:
+        _init_cleaner(strip, color, stream, minifier)
+        # the input files are read ahead of cleaning them
+        in_files = read_files(svg_file_path for svg_file_path, _ in tasks)
+        results = [_clean_svg_file(svg_file_path, out_path, data)
+                   for (_, out_path), (svg_file_path, _, data) in zip(
+                       tasks, in_files)]
+
+    failed = []
+    minify_stats = {}  # key: file path; value: minifier byte counts
+    for i, ((svg_file_path, _), (error, out_hash, stats)) in enumerate(
+            zip(tasks, results)):
+        if error:
+            log.error("Failed to clean '{}'. {}".format(svg_file_path, error))
+            failed.append(svg_file_path)
+        else:
+            count += 1
+            if stats:
+                minify_stats[svg_file_path] = stats
+        if incremental:
+            files[os.path.basename(svg_file_path)] = [in_hashes[i], out_hash]
+
+    copied = 0
+    for source_path, copy_paths in copies.items():
+        source_failed = source_path in failed
+        out_hash = None
+        if incremental:
+            out_hash = files[os.path.basename(source_path)][1]
+        for copy_path in copy_paths:
+            if incremental:
+                # a copy has no input hash of its own; it's recorded so that
+                # its output is removed along with it
+                files[os.path.basename(copy_path)] = [None, out_hash]
+            if source_failed:
+                log.error("Failed to clean '{}'. Its source file '{}' "
+                          "failed.".format(copy_path, source_path))
+                failed.append(copy_path)
+            elif copy_clean_file(get_out_path(source_path, out_dir),
+                                 get_out_path(copy_path, out_dir)):
+                copied += 1
+
+    if incremental:
+        if out_dir:
+            # remove the outputs whose input files are gone
+            in_names = {os.path.basename(fpath) for fpath in file_paths}
+            removed = 0
+            for file_name in set(prev_files).difference(in_names):
+                stale_path = os.path.join(out_dir, file_name)
+                if os.path.isfile(stale_path):
+                    os.remove(stale_path)
+                    log.debug('removed: %s', stale_path)
+                    removed += 1
+            if removed:
+                log.info("Removed {} SVG files whose sources no longer "
+                         "exist.".format(removed))
+        write_manifest(out_folder, settings, files)
+
+    if minifier:
+        report = get_minify_report(minifier, minify_stats)
+        log.info("Minified {} paths from {} to {} bytes ({} kept as they "
+                 "were), and gradient stops from {} to {} bytes.".format(
+                     report['paths'], report['path_bytes'],
+                     report['minified_path_bytes'],
+                     report['unchanged_paths'], report['stop_bytes'],
+                     report['minified_stop_bytes']))
+        if report_path:
+            with io.open(report_path, 'w', encoding='utf-8') as fp:
+                json.dump(report, fp, indent=2)
+            log.info("Saved minification report '{}'.".format(report_path))
 
     if skipped:
         log.info("Skipped {} file aliases.".format(skipped))
 
+    if copied:
+        log.info("Wrote the cleaned data of {} listed aliases.".format(
+            copied))
+
+    if unchanged:
+        log.info("Skipped {} unchanged files.".format(unchanged))
+
+    if failed:
+        log.error("Failed to clean {} SVG files.".format(len(failed)))
+
     log.info("Saved {} clean SVG files in '{}'.".format(count, out_folder))
+    return failed
+
+
+def validate_precision(precision_str):
+    try:
+        precision = int(precision_str)
+    except ValueError:
+        precision = -1
+    if not 0 <= precision <= MAX_PATH_PRECISION:
+        raise argparse.ArgumentTypeError(
+            "The precision must be an integer from 0 to {}.".format(
+                MAX_PATH_PRECISION))
+    return precision
+
+
+def validate_tolerance(tolerance_str):
+    try:
+        tolerance = float(tolerance_str)
+    except ValueError:
+        tolerance = 0
+    if not tolerance > 0:
+        raise argparse.ArgumentTypeError(
+            "The tolerance must be a positive number.")
+    return tolerance
 
 
 def main(args=None):
@@ -406,6 +1254,75 @@ def main(args=None):
         choices=('bw', 'color'),
         default='color'
     )
+    parser.add_argument(
+        '-j',
+        '--jobs',
+        help='number of worker processes. Defaults to %(default)s',
+        type=validate_job_count,
+        default=1,
+    )
+    parser.add_argument(
+        '-s',
+        '--stream',
+        help=('clean the files while they are parsed, instead of building a '
+              'tree of each file first. The output is the same.'),
+        action='store_true'
+    )
+    parser.add_argument(
+        '-i',
+        '--incremental',
+        help=('only clean the files that changed since the last run, and '
+              'delete the outputs of files that no longer exist. The output '
+              'directory is not deleted beforehand.'),
+        action='store_true'
+    )
+    parser.add_argument(
+        '-m',
+        '--minify',
+        help=('shorten the path data and the gradient stops, by rounding the '
+              'coordinates and choosing the shortest notation'),
+        action='store_true'
+    )
+    parser.add_argument(
+        '--precision',
+        help=('number of decimals of the path coordinates, with --minify '
+              '(default: %(default)s)'),
+        type=validate_precision,
+        default=2,
+    )
+    parser.add_argument(
+        '--path-commands',
+        help=('notation of the path commands, with --minify: the shortest of '
+              'absolute and relative coordinates, or always one of them '
+              '(default: %(default)s)'),
+        choices=PATH_COMMANDS,
+        default='shortest',
+    )
+    parser.add_argument(
+        '--tolerance',
+        help=('largest change of a path coordinate allowed, with --minify. '
+              'More decimals are kept for the paths that would exceed it. '
+              'Defaults to half a unit of the last decimal kept.'),
+        type=validate_tolerance,
+    )
+    parser.add_argument(
+        '--minify-report',
+        help=('path to a JSON file for saving the sizes of the path data and '
+              'the gradient stops before and after minification, per file'),
+        metavar='FILE',
+        type=normalize_path,
+    )
+    parser.add_argument(
+        '--aliases-file',
+        help=('text file listing the aliases of the SVG files (e.g. '
+              'emoji_bw_aliases.txt). The aliases that are copies of their '
+              'source file get its cleaned data. Can be used more than once'),
+        metavar='FILE',
+        type=validate_file_path,
+        action='append',
+        dest='aliases_files',
+        default=[],
+    )
     opts = parser.parse_args(args)
 
     if not opts.verbose:
@@ -428,19 +1345,31 @@ def main(args=None):
 
     if opts.out_dir:
         out_path = os.path.abspath(os.path.realpath(opts.out_dir))
-        # if directory exists, delete it
-        if os.path.isdir(out_path):
-            shutil.rmtree(out_path)
-            log.info("Deleted directory '{}'.".format(opts.out_dir))
-        # if it's NOT a directory, but exists nevertheless
-        elif os.path.exists(out_path):
-            os.remove(out_path)
-            log.info("Deleted file '{}'.".format(opts.out_dir))
-        # make directory
-        os.makedirs(out_path)
-
-    clean_svg_files(file_paths, opts.out_dir,
-                    strip=opts.strip_whitespace, color=(opts.kind == 'color'))
+        # in incremental mode, keep the directory and its files
+        if not (opts.incremental and os.path.isdir(out_path)):
+            # if directory exists, delete it
+            if os.path.isdir(out_path):
+                shutil.rmtree(out_path)
+                log.info("Deleted directory '{}'.".format(opts.out_dir))
+            # if it's NOT a directory, but exists nevertheless
+            elif os.path.exists(out_path):
+                os.remove(out_path)
+                log.info("Deleted file '{}'.".format(opts.out_dir))
+            # make directory
+            os.makedirs(out_path)
+
+    minifier = None
+    if opts.minify:
+        minifier = SvgMinifier(
+            opts.precision, opts.path_commands, opts.tolerance)
+
+    failed = clean_svg_files(
+        file_paths, opts.out_dir, strip=opts.strip_whitespace,
+        color=(opts.kind == 'color'), jobs=opts.jobs, stream=opts.stream,
+        incremental=opts.incremental, minifier=minifier,
+        report_path=opts.minify_report, aliases_files=opts.aliases_files)
+    if failed:
+        return 1
 
 
 if __name__ == '__main__':
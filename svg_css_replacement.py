@@ -5,9 +5,13 @@ Convert inline CSS in SVG files to SVG attributes
 '''
 
 
+import os
 import pathlib
 import re
 
+from alias_index import AliasIndex
+from file_loader import get_text, read_files
+
 
 def convert_css_to_svg(attr_string):
     '''
@@ -28,11 +32,23 @@ def convert_css_to_svg(attr_string):
 svgs = []
 folders = ['svg', 'svg_bw', 'flags', 'flags_bw']
 for folder in folders:
-    svgs.extend(pathlib.Path(folder).glob('*.svg'))
+    svgs.extend(sorted(pathlib.Path(folder).glob('*.svg')))
 
+# links to other files (symlinks, or their stand-ins) are skipped, as they
+# share the file of their source; the copies listed in the aliases files get
+# the fixed data of their source
+aliases_files = ['emoji_color_aliases.txt', 'emoji_bw_aliases.txt',
+                 'flag_color_aliases.txt', 'flag_bw_aliases.txt']
+alias_index = AliasIndex(svgs, aliases_files)
+copies = {}  # key: real path of a source file; value: list of copy paths
 for svg in svgs:
-    with open(svg, 'r') as svg_in:
-        svg_data = svg_in.read()
+    if alias_index.is_alias(svg) and not alias_index.is_link(svg):
+        copies.setdefault(alias_index.get_source(svg), []).append(svg)
+svgs = [svg for svg in svgs if not alias_index.is_alias(svg)]
+
+# the files are read ahead of being checked by a pool of threads
+for svg, _, data in read_files(svgs):
+    svg_data = get_text(svg, data)
 
     # check if a SVG even contains an inline style
     if re.findall(r'style="', svg_data):
@@ -51,6 +67,7 @@ for svg in svgs:
             else:
                 fixed_svg.append(line)
 
-        # save the SVG
-        with open(svg, 'w') as svg_out:
-            svg_out.write('\n'.join(fixed_svg))
+        # save the SVG, and its copies
+        for out_svg in [svg] + copies.get(os.path.realpath(svg), []):
+            with open(out_svg, 'w') as svg_out:
+                svg_out.write('\n'.join(fixed_svg))
@@ -0,0 +1,165 @@
+"""
+Makes WOFF2 and WOFF versions of OpenType fonts for use on the web, and
+writes them next to the fonts. The fonts and formats are compressed
+concurrently, each of them in a process of its own, up to one process per
+CPU.
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import io
+import logging
+import os
+import time
+
+from fontTools.ttLib import TTFont
+from fontTools.ttLib.woff2 import WOFF2FlavorData
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+WEB_FORMATS = ('woff2', 'woff')
+# Tables that get the WOFF2 preprocessing transforms in TrueType fonts. The
+# 'hmtx' transform is only defined along with the 'glyf' one, and WOFF2 has no
+# transform for the 'CFF ' table, so the OT-CFF fonts built here get none.
+WOFF2_TRUETYPE_TRANSFORM_TABLES = ('glyf', 'loca', 'hmtx')
+
+log = logging.getLogger('web_fonts')
+
+
+def get_web_font_path(font_path, web_format):
+    return '{}.{}'.format(os.path.splitext(font_path)[0], web_format)
+
+
+def compress_font_data(font_data, web_format):
+    """
+    Returns the data of an OpenType font converted to a web font format
+    ('woff2' or 'woff'). The tables are copied without being recompiled.
+    """
+    font = TTFont(io.BytesIO(font_data), recalcBBoxes=False,
+                  recalcTimestamp=False)
+    font.flavor = web_format
+    if web_format == 'woff2':
+        # the transforms are picked from the outlines: only a font with a
+        # 'glyf' table can have them, an OT-CFF font is compressed as is
+        transformed_tables = (WOFF2_TRUETYPE_TRANSFORM_TABLES
+                              if 'glyf' in font else ())
+        font.flavorData = WOFF2FlavorData(
+            transformedTables=transformed_tables)
+    buf = io.BytesIO()
+    font.save(buf, reorderTables=False)
+    font.close()
+    return buf.getvalue()
+
+
+def write_web_font(font_path, font_data, web_format):
+    """
+    Converts a font to a web font format and writes it next to 'font_path'.
+    If 'font_data' is None the font is read from 'font_path'.
+    Returns a tuple of the web font's path, its size and the seconds spent
+    converting it.
+    """
+    if font_data is None:
+        with io.open(font_path, 'rb') as fp:
+            font_data = fp.read()
+    start = time.perf_counter()
+    web_font_data = compress_font_data(font_data, web_format)
+    seconds = time.perf_counter() - start
+    web_font_path = get_web_font_path(font_path, web_format)
+    with io.open(web_font_path, 'wb') as fp:
+        fp.write(web_font_data)
+    return web_font_path, len(web_font_data), seconds
+
+
+def make_web_fonts(fonts, web_formats, jobs=None):
+    """
+    Writes the web fonts of each font in each of 'web_formats'. 'fonts' is a
+    list of tuples of a font's path and data (or None, to read the font from
+    its path). The web fonts are made using 'jobs' processes, at most one
+    per CPU; by default there is one process per web font.
+    Returns a list of dictionaries containing the path, the format, the size
+    and the conversion time of each font and web font.
+    """
+    tasks = [(font_path, font_data, web_format)
+             for font_path, font_data in fonts
+             for web_format in web_formats]
+    if not tasks:
+        return []
+    jobs = min(jobs or len(tasks), os.cpu_count() or 1)
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(tasks))) as pool:
+            results = list(pool.map(write_web_font, *zip(*tasks)))
+    else:
+        results = [write_web_font(*task) for task in tasks]
+
+    # the results are in the order of the tasks
+    results = iter(results)
+    rows = []
+    for font_path, font_data in fonts:
+        size = (len(font_data) if font_data is not None
+                else os.path.getsize(font_path))
+        rows.append({'path': font_path, 'format': 'otf', 'size': size,
+                     'seconds': None})
+        for web_format in web_formats:
+            web_font_path, web_size, seconds = next(results)
+            log.info("Wrote '{}' in {:.2f} s.".format(web_font_path, seconds))
+            rows.append({'path': web_font_path, 'format': web_format,
+                         'size': web_size, 'seconds': seconds})
+    return rows
+
+
+def format_web_fonts_table(rows):
+    """
+    Takes the list returned by make_web_fonts(), and returns a table of the
+    sizes and conversion times as a string. The size of each web font is
+    also given as a percentage of the size of its OpenType font.
+    """
+    header = ('File', 'Format', 'Bytes', 'Size', 'Seconds')
+    table_rows = []
+    font_size = None
+    for row in rows:
+        if row['format'] == 'otf':
+            font_size = row['size']
+            ratio, seconds = '', ''
+        else:
+            ratio = '{:.1%}'.format(row['size'] / font_size)
+            seconds = '{:.2f}'.format(row['seconds'])
+        table_rows.append((os.path.basename(row['path']), row['format'],
+                           str(row['size']), ratio, seconds))
+
+    widths = [max(len(row[i]) for row in [header] + table_rows)
+              for i in range(len(header))]
+    lines = []
+    for row in [header] + table_rows:
+        cells = [cell.ljust(width) for cell, width in zip(row[:2], widths)]
+        cells.extend(cell.rjust(width)
+                     for cell, width in zip(row[2:], widths[2:]))
+        lines.append('  '.join(cells).rstrip())
+    lines.insert(1, '-' * len(lines[0]))
+    return '\n'.join(lines)
+
+
+def validate_web_formats(formats_str):
+    web_formats = []
+    for web_format in formats_str.lower().split(','):
+        web_format = web_format.strip()
+        if web_format not in WEB_FORMATS:
+            raise argparse.ArgumentTypeError(
+                "'{}' is not a web font format. Valid formats are: {}".format(
+                    web_format, ', '.join(WEB_FORMATS)))
+        if web_format not in web_formats:
+            web_formats.append(web_format)
+    return web_formats
+
+
+def check_web_formats(web_formats):
+    """
+    Logs an error and returns False if the WOFF2 format is requested but the
+    'brotli' package isn't installed.
+    """
+    if 'woff2' in web_formats and brotli is None:
+        log.error("The 'woff2' format requires the 'brotli' package. "
+                  "Install it with 'pip install brotli'.")
+        return False
+    return True